@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""Find capture and playback buffer sizes for the configured audio devices.
+
+Usage:
+    python audio_autotune.py
+    python audio_autotune.py --input-device ReSpeaker --output-device bluez --load 0.7
+    python audio_autotune.py --input-sizes 512 1000 2000 4000 --seconds 20
+
+Too small a buffer gives overflows and underruns, too large a buffer adds
+latency. For each candidate size the command runs `StationAudioInterface`
+on the real devices for `--seconds`: the microphone is captured as in a
+session, and a quiet tone (or silence with `--silent`) is kept queued for
+playback. Meanwhile synthetic load runs: `--load-workers` processes that
+keep each core busy `--load` of the time, plus a thread that holds the GIL
+`--gil-load` of the time like the SDK's and our own Python threads do.
+
+Measured per run: input overflows/underflows and output underflows per
+minute, the spread of the input callback intervals, and the latency the
+buffers add (buffer length plus the stream latency PortAudio reports).
+
+Input sizes are swept first with the default output size, then output
+sizes with the chosen input size. The smallest-latency setting with at
+most `--max-xruns-per-minute` xruns wins and is written to the profile
+(AUDIO_PROFILE, default audio_profile.json) under the device names, where
+`StationAudioInterface` picks it up at startup. The devices default to
+INPUT_DEVICE and OUTPUT_DEVICE, which hotword.py opens as well, so the
+profile applies to the devices a session actually uses. PyAudio does not expose
+PortAudio's suggested latency (it always asks for the device's default
+low latency), so the frames-per-buffer sizes are what gets tuned.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+import audio_interface
+from audio_interface import (
+    OUTPUT_FRAMES_PER_BUFFER,
+    SAMPLE_RATE,
+    XRUN_KINDS,
+    StationAudioInterface,
+    device_name,
+    profile_key,
+    resolve_device,
+)
+
+DEFAULT_INPUT_SIZES = (512, 1024, 2000, 4000)
+DEFAULT_OUTPUT_SIZES = (256, 512, 1000, 2000)
+LOAD_PERIOD_SECONDS = 0.01
+# Keep this much audio queued for playback so the feeder never causes underruns
+PLAYBACK_LEAD_SECONDS = 0.3
+
+
+def burn(duty: float, stop, period=LOAD_PERIOD_SECONDS):
+    """Busy-loop `duty` of every period until `stop` is set."""
+    while not stop.is_set():
+        busy_until = time.perf_counter() + duty * period
+        while time.perf_counter() < busy_until:
+            pass
+        time.sleep((1.0 - duty) * period)
+
+
+class SyntheticLoad:
+    """CPU load in worker processes plus GIL load in this process."""
+
+    def __init__(self, cpu_duty: float, workers: int, gil_duty: float):
+        self.cpu_duty = cpu_duty
+        self.workers = workers
+        self.gil_duty = gil_duty
+        self._processes = []
+        self._thread = None
+        self._process_stop = multiprocessing.Event()
+        self._thread_stop = threading.Event()
+
+    def __enter__(self):
+        if self.cpu_duty > 0:
+            for _ in range(self.workers):
+                process = multiprocessing.Process(
+                    target=burn, args=(self.cpu_duty, self._process_stop), daemon=True
+                )
+                process.start()
+                self._processes.append(process)
+        if self.gil_duty > 0:
+            self._thread = threading.Thread(
+                target=burn, args=(self.gil_duty, self._thread_stop), name="gil-load", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._process_stop.set()
+        self._thread_stop.set()
+        for process in self._processes:
+            process.join()
+        if self._thread:
+            self._thread.join()
+
+
+def tone(frames: int, level_dbfs: float) -> bytes:
+    t = np.arange(frames) / SAMPLE_RATE
+    amplitude = 32767 * 10 ** (level_dbfs / 20)
+    return (np.sin(2 * np.pi * 440 * t) * amplitude).astype(np.int16).tobytes()
+
+
+def measure(audio, args, input_index, output_index, input_size, output_size) -> dict:
+    """Run the devices with one pair of buffer sizes and return the results."""
+    interface = StationAudioInterface(
+        input_device_index=input_index,
+        output_device_index=output_index,
+        audio=audio,
+        input_channels=args.input_channels,
+        input_channel=args.input_channel,
+        input_frames_per_buffer=input_size,
+        output_frames_per_buffer=output_size,
+    )
+    callback_times = []
+    interface.start(lambda data: callback_times.append(time.monotonic()))
+
+    chunk = tone(output_size, args.tone_dbfs) if not args.silent else bytes(output_size * 2)
+    chunk_seconds = output_size / SAMPLE_RATE
+    started = time.monotonic()
+    queued_until = started
+    try:
+        while True:
+            now = time.monotonic()
+            if now - started >= args.seconds:
+                break
+            while queued_until < now + PLAYBACK_LEAD_SECONDS:
+                interface.output(chunk)
+                queued_until += chunk_seconds
+            time.sleep(chunk_seconds / 2)
+        input_latency = interface.in_stream.get_input_latency()
+        output_latency = interface.out_stream.get_output_latency()
+    finally:
+        interface.interrupt()
+        interface.stop()
+
+    minutes = args.seconds / 60
+    intervals = np.diff(callback_times) * 1000 if len(callback_times) > 2 else np.zeros(1)
+    expected_ms = input_size / SAMPLE_RATE * 1000
+    xruns = {kind: interface.xruns[kind] / minutes for kind in XRUN_KINDS}
+    return {
+        "input_frames_per_buffer": input_size,
+        "output_frames_per_buffer": output_size,
+        "xruns_per_minute": {kind: round(rate, 2) for kind, rate in xruns.items()},
+        "total_xruns_per_minute": round(sum(xruns.values()), 2),
+        "callback_jitter_ms": round(float(np.percentile(np.abs(intervals - expected_ms), 99)), 2),
+        "late_callbacks": int(np.sum(intervals > 1.5 * expected_ms)),
+        "input_latency_ms": round((input_size / SAMPLE_RATE + input_latency) * 1000, 1),
+        "output_latency_ms": round((output_size / SAMPLE_RATE + output_latency) * 1000, 1),
+    }
+
+
+def best(results: list, max_xruns: float, latency_key: str) -> dict:
+    """Lowest latency within the xrun budget, else the fewest xruns."""
+    within = [r for r in results if r["total_xruns_per_minute"] <= max_xruns]
+    if within:
+        return min(within, key=lambda r: r[latency_key])
+    return min(results, key=lambda r: (r["total_xruns_per_minute"], r[latency_key]))
+
+
+def print_result(result: dict):
+    print(
+        f"  in {result['input_frames_per_buffer']:>5} / out {result['output_frames_per_buffer']:>5}: "
+        f"{result['total_xruns_per_minute']:>6.2f} xruns/min, jitter p99 "
+        f"{result['callback_jitter_ms']:>6.2f} ms, latency in {result['input_latency_ms']:>6.1f} ms "
+        f"out {result['output_latency_ms']:>6.1f} ms"
+    )
+
+
+def write_profile(path: str, key: str, entry: dict):
+    """Merge `entry` into the profile under `key`, replacing the file atomically."""
+    try:
+        with open(path, "r", encoding="utf-8") as profile_file:
+            profile = json.load(profile_file)
+    except (FileNotFoundError, ValueError):
+        profile = {}
+    profile.setdefault("devices", {})[key] = entry
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as profile_file:
+        json.dump(profile, profile_file, indent=2, ensure_ascii=False)
+        profile_file.write("\n")
+    os.replace(temporary, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune audio buffer sizes for the configured devices.")
+    parser.add_argument("--input-device", default=os.getenv("INPUT_DEVICE"),
+                        help="device index or name fragment (default: INPUT_DEVICE or the system default)")
+    parser.add_argument("--output-device", default=os.getenv("OUTPUT_DEVICE"),
+                        help="device index or name fragment (default: OUTPUT_DEVICE or the system default)")
+    parser.add_argument("--input-channels", type=int, default=int(os.getenv("INPUT_CHANNELS", "1")))
+    parser.add_argument("--input-channel", type=int, default=int(os.getenv("INPUT_CHANNEL", "0")))
+    parser.add_argument("--input-sizes", type=int, nargs="+", default=DEFAULT_INPUT_SIZES)
+    parser.add_argument("--output-sizes", type=int, nargs="+", default=DEFAULT_OUTPUT_SIZES)
+    parser.add_argument("--seconds", type=float, default=10.0, help="duration of each run")
+    parser.add_argument("--load", type=float, default=0.6, help="busy fraction of each load process")
+    parser.add_argument("--load-workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--gil-load", type=float, default=0.2,
+                        help="fraction of time a Python thread holds the GIL")
+    parser.add_argument("--max-xruns-per-minute", type=float, default=0.5)
+    parser.add_argument("--silent", action="store_true", help="play silence instead of a tone")
+    parser.add_argument("--tone-dbfs", type=float, default=-40.0)
+    parser.add_argument("--profile", default=os.getenv("AUDIO_PROFILE", audio_interface.DEFAULT_PROFILE_PATH))
+    parser.add_argument("--dry-run", action="store_true", help="do not write the profile")
+    args = parser.parse_args()
+
+    import pyaudio
+    audio = pyaudio.PyAudio()
+    try:
+        input_index = resolve_device(audio, args.input_device, True)
+        output_index = resolve_device(audio, args.output_device, False)
+        input_name = device_name(audio, input_index, True)
+        output_name = device_name(audio, output_index, False)
+        print(f"Input: {input_name}, output: {output_name}")
+        print(
+            f"Load: {args.load_workers} processes at {args.load:.0%}, GIL {args.gil_load:.0%}, "
+            f"{args.seconds:g} s per run"
+        )
+
+        with SyntheticLoad(args.load, args.load_workers, args.gil_load):
+            print("Input sizes:")
+            input_results = []
+            for size in args.input_sizes:
+                result = measure(audio, args, input_index, output_index, size, OUTPUT_FRAMES_PER_BUFFER)
+                print_result(result)
+                input_results.append(result)
+            input_size = best(input_results, args.max_xruns_per_minute,
+                              "input_latency_ms")["input_frames_per_buffer"]
+
+            print("Output sizes:")
+            output_results = []
+            for size in args.output_sizes:
+                result = measure(audio, args, input_index, output_index, input_size, size)
+                print_result(result)
+                output_results.append(result)
+            chosen = best(output_results, args.max_xruns_per_minute, "output_latency_ms")
+    finally:
+        audio.terminate()
+
+    print("Chosen:")
+    print_result(chosen)
+    if chosen["total_xruns_per_minute"] > args.max_xruns_per_minute:
+        print(f"No size stayed within {args.max_xruns_per_minute:g} xruns/min; "
+              f"using the one with the fewest.")
+    if args.dry_run:
+        return
+
+    entry = dict(
+        chosen,
+        tuned=time.strftime("%Y-%m-%d %H:%M:%S"),
+        load={"cpu": args.load, "workers": args.load_workers, "gil": args.gil_load},
+        sweep=input_results + output_results,
+    )
+    write_profile(args.profile, profile_key(input_name, output_name), entry)
+    print(f"Written to {args.profile}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,356 @@
+"""Audio interface used for ElevenLabs sessions.
+
+Behaves like the SDK's `DefaultAudioInterface` (16 kHz, 16-bit mono PCM,
+one input callback stream and one output writer thread) but lets a caller
+pick the input/output device and share one PortAudio instance between
+several stations in the same process.
+
+Taps are plain callables that receive every captured input chunk (on the
+PortAudio callback thread) and every output chunk right before it is
+played (on the output thread). They must return quickly and never block.
+
+Multi-channel capture devices can be opened with `input_channels` > 1; only
+`input_channel` is passed on. With the 6-channel ReSpeaker USB Mic Array
+firmware, channel 0 is the processed (echo-cancelled, beamformed) signal
+and channels 1-4 are the raw microphones.
+
+`hold_output()` stops playback immediately by moving queued audio aside,
+for local barge-in; `release_output()` plays the held audio after all, and
+the server's `interrupt()` discards it.
+
+Buffer sizes come from the profile written by `audio_autotune.py`, looked
+up by the input and output device names, and fall back to the
+`DefaultAudioInterface` sizes for devices that have not been tuned.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+import weakref
+
+import pyaudio
+
+from elevenlabs.conversational_ai.conversation import AudioInterface
+
+import scheduling
+
+SAMPLE_RATE = 16000
+INPUT_FRAMES_PER_BUFFER = 4000  # 250ms @ 16kHz, same as DefaultAudioInterface
+OUTPUT_FRAMES_PER_BUFFER = 1000  # 62.5ms @ 16kHz
+# An output underflow only counts as an xrun if the previous chunk was
+# written this recently; the first write after a pause always underflows.
+UNDERRUN_GAP_SECONDS = 0.5
+# Playback counts as ongoing this long after the last chunk was written
+PLAYBACK_TAIL_SECONDS = 0.3
+XRUN_KINDS = ("input_overflow", "input_underflow", "output_underflow")
+DEFAULT_PROFILE_PATH = "audio_profile.json"
+
+# "<input device name>|<output device name>" -> tuned settings
+_profile = {}
+
+# Xrun counts of stopped interfaces, plus the interfaces still running
+_finished_xruns = dict.fromkeys(XRUN_KINDS, 0)
+_xrun_lock = threading.Lock()
+_live_interfaces = weakref.WeakSet()
+
+# PortAudio's API is not thread-safe and its state is process-wide, so
+# stations opening or closing streams at the same time take turns
+_portaudio_lock = threading.Lock()
+
+
+def xrun_counts() -> dict:
+    """Total input/output xruns of every interface in this process."""
+    with _xrun_lock:
+        totals = dict(_finished_xruns)
+        live = list(_live_interfaces)
+    for interface in live:
+        for kind in XRUN_KINDS:
+            totals[kind] += interface.xruns[kind]
+    return totals
+
+
+def profile_key(input_name: str, output_name: str) -> str:
+    return f"{input_name}|{output_name}"
+
+
+def load_profile(path=None) -> dict:
+    """Load the autotune profile (AUDIO_PROFILE, default audio_profile.json).
+
+    Missing or unreadable files leave the default buffer sizes in place.
+    """
+    global _profile
+    path = path or os.getenv("AUDIO_PROFILE", DEFAULT_PROFILE_PATH)
+    try:
+        with open(path, "r", encoding="utf-8") as profile_file:
+            _profile = json.load(profile_file).get("devices", {})
+    except FileNotFoundError:
+        _profile = {}
+    except (OSError, ValueError) as e:
+        print(f"Ignoring audio profile {path}: {e}")
+        _profile = {}
+    if _profile:
+        print(f"Audio profile {path}: tuned buffer sizes for {len(_profile)} device pair(s)")
+    return _profile
+
+
+def device_name(audio: pyaudio.PyAudio, index, want_input: bool) -> str:
+    """PortAudio name of a device index (None means the default device)."""
+    try:
+        if index is None:
+            info = (audio.get_default_input_device_info() if want_input
+                    else audio.get_default_output_device_info())
+        else:
+            info = audio.get_device_info_by_index(index)
+    except (OSError, IOError):
+        return "default"
+    return info.get("name", "default")
+
+
+def tuned_buffer_sizes(audio: pyaudio.PyAudio, input_device_index, output_device_index):
+    """(input, output) frames per buffer from the profile, or the defaults."""
+    if _profile:
+        entry = _profile.get(profile_key(
+            device_name(audio, input_device_index, True),
+            device_name(audio, output_device_index, False),
+        ))
+        if entry:
+            return entry["input_frames_per_buffer"], entry["output_frames_per_buffer"]
+    return INPUT_FRAMES_PER_BUFFER, OUTPUT_FRAMES_PER_BUFFER
+
+
+def resolve_device(audio: pyaudio.PyAudio, spec, want_input: bool):
+    """Turn a device index or name fragment into a PortAudio device index.
+
+    `None` means the system default. Names match case-insensitively on the
+    first device with channels in the wanted direction, so "ReSpeaker" is
+    enough to find the USB mic array.
+    """
+    if spec is None or spec == "":
+        return None
+    if isinstance(spec, int) or str(spec).isdigit():
+        return int(spec)
+
+    channel_key = "maxInputChannels" if want_input else "maxOutputChannels"
+    wanted = str(spec).lower()
+    for index in range(audio.get_device_count()):
+        try:
+            info = audio.get_device_info_by_index(index)
+        except (OSError, IOError):
+            continue
+        if info.get(channel_key, 0) > 0 and wanted in info.get("name", "").lower():
+            return index
+    raise ValueError(
+        f"No {'input' if want_input else 'output'} device matches '{spec}'"
+    )
+
+
+class StationAudioInterface(AudioInterface):
+    """PyAudio based audio interface with selectable devices."""
+
+    def __init__(self, input_device_index=None, output_device_index=None, audio=None,
+                 input_channels=1, input_channel=0, input_frames_per_buffer=None,
+                 output_frames_per_buffer=None):
+        if not 0 <= input_channel < input_channels:
+            raise ValueError(f"input_channel {input_channel} is not one of {input_channels} channels")
+        self.input_device_index = input_device_index
+        self.output_device_index = output_device_index
+        self.input_channels = input_channels
+        self.input_channel = input_channel
+        # None: taken from the autotune profile when the streams open
+        self.input_frames_per_buffer = input_frames_per_buffer
+        self.output_frames_per_buffer = output_frames_per_buffer
+        # A shared PyAudio instance is owned by the caller and never terminated here.
+        self.shared_audio = audio
+        self.input_callback = None
+        self.p = None
+        self.in_stream = None
+        self.out_stream = None
+        self.input_taps = []
+        self.output_taps = []
+        # Called with no arguments when the server interrupts playback
+        self.interrupt_listeners = []
+        # Each counter is only written by one audio thread
+        self.xruns = dict.fromkeys(XRUN_KINDS, 0)
+        self._last_write = 0.0
+        # Guards output_queue against hold/release from the input thread
+        self._output_lock = threading.Lock()
+        self._held = None  # list of held chunks while output is held
+        self._held_bytes = 0
+        self._held_limit = None  # bytes of held audio kept, None for all
+        self._input_scheduled = False
+        self._callback_thread = None  # ident of PortAudio's input callback thread
+        # stop() runs once per start(); the SDK calls it from both the
+        # websocket thread and the input callback when a session ends
+        self._stop_lock = threading.Lock()
+        self._stopping = False
+        # Replaced in start(); exists before it so taps can ask playing()
+        self.output_queue = queue.Queue()
+
+    def start(self, input_callback):
+        self.input_callback = input_callback
+        self._input_scheduled = False  # each stream gets a new callback thread
+        self._callback_thread = None
+        self._stopping = False
+        self.output_queue = queue.Queue()
+        self.should_stop = threading.Event()
+        self.output_thread = threading.Thread(target=self._output_thread, daemon=True)
+
+        with _portaudio_lock:
+            self.p = self.shared_audio or pyaudio.PyAudio()
+            if self.input_frames_per_buffer is None or self.output_frames_per_buffer is None:
+                tuned_input, tuned_output = tuned_buffer_sizes(
+                    self.p, self.input_device_index, self.output_device_index
+                )
+                self.input_frames_per_buffer = self.input_frames_per_buffer or tuned_input
+                self.output_frames_per_buffer = self.output_frames_per_buffer or tuned_output
+            self.in_stream = self.p.open(
+                format=pyaudio.paInt16,
+                channels=self.input_channels,
+                rate=SAMPLE_RATE,
+                input=True,
+                input_device_index=self.input_device_index,
+                stream_callback=self._in_callback,
+                frames_per_buffer=self.input_frames_per_buffer,
+                start=True,
+            )
+            self.out_stream = self.p.open(
+                format=pyaudio.paInt16,
+                channels=1,
+                rate=SAMPLE_RATE,
+                output=True,
+                output_device_index=self.output_device_index,
+                frames_per_buffer=self.output_frames_per_buffer,
+                start=True,
+            )
+        with _xrun_lock:
+            _live_interfaces.add(self)
+        self.output_thread.start()
+
+    def stop(self):
+        with self._stop_lock:
+            if self._stopping:
+                return
+            self._stopping = True
+        self.should_stop.set()
+        if threading.get_ident() == self._callback_thread:
+            # Stopping the stream waits for the callback we are running in;
+            # the callback returns paComplete and another thread closes it
+            threading.Thread(target=self._close, name="audio-close", daemon=True).start()
+            return
+        self._close()
+
+    def _close(self):
+        self.output_thread.join()
+        self.in_stream.stop_stream()
+        with _portaudio_lock:
+            self.in_stream.close()
+            self.out_stream.close()
+            if self.shared_audio is None:
+                self.p.terminate()
+        with _xrun_lock:
+            _live_interfaces.discard(self)
+            for kind in XRUN_KINDS:
+                _finished_xruns[kind] += self.xruns[kind]
+
+    def output(self, audio: bytes):
+        with self._output_lock:
+            if self._held is not None:
+                self._held.append(audio)
+                self._held_bytes += len(audio)
+                self._trim_held()
+            else:
+                self.output_queue.put(audio)
+
+    def interrupt(self):
+        with self._output_lock:
+            self._held = None
+            self._drain()
+        for listener in self.interrupt_listeners:
+            listener()
+
+    def hold_output(self, max_seconds=None):
+        """Stop playback now, keeping queued and incoming audio aside.
+
+        With `max_seconds`, only the latest that much audio is kept.
+        """
+        with self._output_lock:
+            if self._held is None:
+                self._held = self._drain()
+                self._held_bytes = sum(len(audio) for audio in self._held)
+                self._held_limit = int(max_seconds * SAMPLE_RATE) * 2 if max_seconds else None
+                self._trim_held()
+
+    def release_output(self):
+        """Play audio held by `hold_output()`, e.g. after a false barge-in."""
+        with self._output_lock:
+            held, self._held = self._held, None
+            for audio in held or ():
+                self.output_queue.put(audio)
+
+    @property
+    def output_held(self) -> bool:
+        return self._held is not None
+
+    def playing(self) -> bool:
+        """Whether agent audio is queued or was played a moment ago."""
+        return (
+            not self.output_queue.empty()
+            or time.monotonic() - self._last_write < PLAYBACK_TAIL_SECONDS
+        )
+
+    def _trim_held(self):
+        """Drop the oldest held audio beyond the limit. Call with the lock held."""
+        if self._held_limit is None:
+            return
+        while self._held and self._held_bytes - len(self._held[0]) >= self._held_limit:
+            self._held_bytes -= len(self._held.pop(0))
+
+    def _drain(self) -> list:
+        drained = []
+        try:
+            while True:
+                drained.append(self.output_queue.get(block=False))
+        except queue.Empty:
+            pass
+        return drained
+
+    def _output_thread(self):
+        scheduling.apply("audio")
+        while not self.should_stop.is_set():
+            try:
+                audio = self.output_queue.get(timeout=0.25)
+            except queue.Empty:
+                continue
+            for tap in self.output_taps:
+                tap(audio)
+            try:
+                self.out_stream.write(audio, exception_on_underflow=True)
+            except IOError as e:
+                if e.args[-1] != pyaudio.paOutputUnderflowed:
+                    raise
+                # The chunk was still played; only count underruns mid-speech
+                if time.monotonic() - self._last_write < UNDERRUN_GAP_SECONDS:
+                    self.xruns["output_underflow"] += 1
+            self._last_write = time.monotonic()
+
+    def _in_callback(self, in_data, frame_count, time_info, status):
+        if not self._input_scheduled:
+            self._input_scheduled = True
+            self._callback_thread = threading.get_ident()
+            scheduling.apply("audio")
+        if self.should_stop.is_set():
+            return (None, pyaudio.paComplete)
+        if status:
+            if status & pyaudio.paInputOverflow:
+                self.xruns["input_overflow"] += 1
+            if status & pyaudio.paInputUnderflow:
+                self.xruns["input_underflow"] += 1
+        if self.input_channels > 1:
+            in_data = memoryview(in_data).cast("h")[self.input_channel::self.input_channels].tobytes()
+        for tap in self.input_taps:
+            tap(in_data)
+        if self.input_callback:
+            self.input_callback(in_data)
+        return (None, pyaudio.paContinue)
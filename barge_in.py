@@ -0,0 +1,208 @@
+"""Local barge-in: stop the agent's playback as soon as the user talks over it.
+
+Without this, playback only stops when the server's interruption event
+comes back: the server's VAD has to pick the speech out of the uploaded
+audio, and the event has to cross the network. Until then the agent keeps
+talking over the user.
+
+`BargeInDetector` taps the microphone chunks of one session. While the
+agent is playing, it runs a cheap energy VAD over 20 ms frames. A frame
+counts as speech when its energy is above both:
+
+- the noise floor learned while the agent is silent, plus BARGE_IN_SNR_DB,
+- the energy of the audio being played, minus BARGE_IN_ECHO_MARGIN_DB,
+  so the agent's own voice leaking back into the microphone does not
+  trigger it.
+
+After BARGE_IN_MIN_SPEECH_MS of consecutive speech, playback is held
+(`StationAudioInterface.hold_output()`). When the server's interruption
+arrives, the held audio is discarded. If it has not arrived within
+BARGE_IN_HOLD_SECONDS, the detection was false and the held audio is
+played after all, so a cough costs a pause rather than a lost sentence.
+At most BARGE_IN_HOLD_SECONDS of the latest audio is held.
+
+Use the ReSpeaker's processed channel (INPUT_CHANNELS=6, INPUT_CHANNEL=0
+with the 6-channel firmware, or the 1-channel firmware) so that echo
+cancellation has already removed most of the playback.
+
+Every confirmed interruption is reported as a `barge_in` event and as the
+`barge_in_local_ms` (speech onset to local stop) and `barge_in_server_ms`
+(speech onset to the server's interruption, i.e. the latency without local
+barge-in) metrics. By default (BARGE_IN=observe) the detector only
+measures; BARGE_IN=on holds playback once the processed channel is in use.
+"""
+
+import os
+import time
+
+import numpy as np
+
+from audio_interface import SAMPLE_RATE
+
+FRAME_SAMPLES = SAMPLE_RATE // 50  # 20 ms
+FRAME_SECONDS = FRAME_SAMPLES / SAMPLE_RATE
+MODES = ("off", "observe", "on")
+# Server interruptions later than this after a detection are not matched to it
+MATCH_SECONDS = 3.0
+# Noise floor adaptation per chunk while the agent is silent
+NOISE_FLOOR_RATE = 0.1
+# Frame energy of full-scale int16, and the lowest floor considered
+FULL_SCALE_ENERGY = 32768.0 ** 2
+MIN_NOISE_ENERGY = FULL_SCALE_ENERGY * 10 ** (-70 / 10)
+
+DEFAULTS = {
+    "snr_db": ("BARGE_IN_SNR_DB", 12.0),
+    "echo_margin_db": ("BARGE_IN_ECHO_MARGIN_DB", 25.0),
+    "min_level_dbfs": ("BARGE_IN_MIN_DBFS", -45.0),
+    "min_speech_ms": ("BARGE_IN_MIN_SPEECH_MS", 100.0),
+    "hold_seconds": ("BARGE_IN_HOLD_SECONDS", 1.5),
+}
+
+
+def frame_energies(chunk: bytes, frame_samples: int = FRAME_SAMPLES) -> np.ndarray:
+    """Mean square of each complete frame (20 ms by default) of 16-bit PCM."""
+    samples = np.frombuffer(chunk, dtype=np.int16)
+    count = len(samples) // frame_samples
+    if count == 0:
+        return np.empty(0, dtype=np.float32)
+    frames = samples[:count * frame_samples].reshape(count, frame_samples).astype(np.float32)
+    return np.einsum("ij,ij->i", frames, frames) / frame_samples
+
+
+class BargeInDetector:
+    """Energy VAD on one session's microphone while the agent speaks."""
+
+    def __init__(self, mode="observe", metrics=None, event_log=None, station=None, session=None,
+                 snr_db=12.0, echo_margin_db=25.0, min_level_dbfs=-45.0,
+                 min_speech_ms=100.0, hold_seconds=1.5):
+        if mode not in MODES:
+            raise ValueError(f"Barge-in mode must be one of {MODES}, not {mode!r}")
+        self.mode = mode
+        self.metrics = metrics
+        self.event_log = event_log
+        self.station = station
+        self.session = session
+        self.snr = 10 ** (snr_db / 10)
+        self.echo_ratio = 10 ** (-echo_margin_db / 10)
+        self.min_energy = FULL_SCALE_ENERGY * 10 ** (min_level_dbfs / 10)
+        self.min_speech_frames = max(1, round(min_speech_ms / 1000 / FRAME_SECONDS))
+        self.hold_seconds = hold_seconds
+
+        self.interface = None
+        self.noise_energy = MIN_NOISE_ENERGY
+        self.echo_energy = 0.0  # mean square of the chunk being played
+        self._speech_frames = 0
+        self._onset = None  # monotonic time of the detected speech onset
+        self._stopped_at = None  # when playback was held locally
+
+    @classmethod
+    def from_env(cls, metrics=None, event_log=None, station=None, session=None):
+        """Detector configured by BARGE_IN* variables, or None if disabled."""
+        mode = os.getenv("BARGE_IN", "observe").lower()
+        if mode == "off":
+            return None
+        settings = {
+            name: float(os.getenv(variable, default))
+            for name, (variable, default) in DEFAULTS.items()
+        }
+        return cls(mode, metrics, event_log, station, session, **settings)
+
+    def attach(self, audio_interface):
+        """Tap the interface's microphone and playback chunks."""
+        self.interface = audio_interface
+        audio_interface.input_taps.append(self._on_input)
+        audio_interface.output_taps.append(self._on_output)
+        audio_interface.interrupt_listeners.append(self._on_server_interrupt)
+
+    # Audio threads
+
+    def _on_output(self, chunk: bytes):
+        energies = frame_energies(chunk)
+        self.echo_energy = float(energies.max()) if len(energies) else 0.0
+
+    def _on_input(self, chunk: bytes):
+        energies = frame_energies(chunk)
+        if not len(energies):
+            return
+        now = time.monotonic()
+        if (self._onset is not None and self._stopped_at is None
+                and now - self._onset > MATCH_SECONDS):
+            self._expire()
+
+        if self.interface.output_held:
+            stopped_at = self._stopped_at  # cleared by a server interrupt meanwhile
+            if stopped_at is not None and now - stopped_at > self.hold_seconds:
+                self._release()
+            return
+
+        if not self.interface.playing():
+            self._speech_frames = 0
+            self.noise_energy += NOISE_FLOOR_RATE * (float(np.median(energies)) - self.noise_energy)
+            self.noise_energy = max(self.noise_energy, MIN_NOISE_ENERGY)
+            return
+
+        if self._onset is not None:
+            return  # already detected; waiting for the server
+        for index, voiced in enumerate(self._voiced(energies)):
+            self._speech_frames = self._speech_frames + 1 if voiced else 0
+            if self._speech_frames >= self.min_speech_frames:
+                # The chunk ends now; count back to the first voiced frame
+                frames_ago = len(energies) - index - 1 + self._speech_frames
+                self._detected(now - frames_ago * FRAME_SECONDS, now)
+                return
+
+    def _voiced(self, energies: np.ndarray) -> np.ndarray:
+        threshold = max(
+            self.noise_energy * self.snr,
+            self.echo_energy * self.echo_ratio,
+            self.min_energy,
+        )
+        return energies > threshold
+
+    def _detected(self, onset: float, now: float):
+        self._onset = onset
+        self._speech_frames = 0
+        if self.mode == "on":
+            self.interface.hold_output(self.hold_seconds)
+            self._stopped_at = now
+
+    def _release(self):
+        """The server never confirmed; play the held audio."""
+        self.interface.release_output()
+        self._report("barge_in_false", confirmed=False)
+        self._onset = self._stopped_at = None
+
+    def _expire(self):
+        """Observe mode: a detection the server never confirmed."""
+        self._report("barge_in_false", confirmed=False)
+        self._onset = self._stopped_at = None
+
+    # Websocket thread
+
+    def _on_server_interrupt(self):
+        onset, stopped_at = self._onset, self._stopped_at
+        self._onset = self._stopped_at = None
+        now = time.monotonic()
+        if onset is None:
+            self._report("barge_in_missed", confirmed=True)
+            return
+        server_ms = (now - onset) * 1000
+        local_ms = (stopped_at - onset) * 1000 if stopped_at is not None else None
+        if self.metrics:
+            self.metrics.record(self.station, "barge_in_server_ms", server_ms)
+            if local_ms is not None:
+                self.metrics.record(self.station, "barge_in_local_ms", local_ms)
+        self._report(
+            "barge_ins", confirmed=True,
+            local_ms=round(local_ms, 1) if local_ms is not None else None,
+            server_ms=round(server_ms, 1),
+        )
+
+    def _report(self, counter: str, **fields):
+        if self.metrics:
+            self.metrics.increment(self.station, counter)
+        if self.event_log:
+            self.event_log.emit(
+                "barge_in", self.session, station=self.station, mode=self.mode,
+                outcome=counter, **fields,
+            )
@@ -0,0 +1,441 @@
+"""Client tools: Python functions the agent can call on the device.
+
+Tools are registered once on a process-wide `ToolExecutor`:
+
+    @client_tool_executor.tool("get_device_status", timeout=2.0, cache_ttl=10)
+    def get_device_status(parameters: dict):
+        ...
+
+and must also be added as client tools (same name and parameters) to the
+agent in the ElevenLabs dashboard. The handler receives the call's
+parameters as a dict and returns a string or a JSON-serialisable value.
+
+The SDK calls `execute_tool()` from its websocket thread. Calls are handed
+to a bounded worker pool (CLIENT_TOOL_WORKERS threads; tools registered
+with `process=True` run in a pool of CLIENT_TOOL_PROCESSES processes for
+CPU-heavy work), so a slow tool never holds up audio or other messages.
+A watchdog answers the agent with an error once a tool exceeds its
+timeout; the worker finishes in the background and its result is dropped.
+When CLIENT_TOOL_MAX_PENDING calls are already running or queued, new
+calls are rejected immediately instead of queueing. A call that timed out
+keeps counting until its worker actually finishes, so hung tools cannot
+pile up work behind them; one that was still queued is cancelled. Calls
+that cannot be started (a broken process pool, which is then replaced, or
+an executor that was closed) are answered with an error.
+
+Tools registered with `cache_ttl` are treated as idempotent: results are
+cached per parameter set for that many seconds, in an LRU of
+CLIENT_TOOL_CACHE_SIZE entries shared by all tools.
+
+Every call records `tool_<name>_ms` for its station in the session metrics,
+counts calls, cache hits, timeouts, errors and rejections, and publishes
+the hit rate as the `client_tools.<name>.hit_rate` gauge.
+"""
+
+import collections
+import heapq
+import itertools
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from elevenlabs.conversational_ai.conversation import ClientTools
+
+DEFAULT_WORKERS = 4
+DEFAULT_PROCESSES = 2
+DEFAULT_CACHE_SIZE = 256
+DEFAULT_TIMEOUT_SECONDS = 5.0
+
+
+class Tool:
+    """A registered tool and its per-tool counters."""
+
+    def __init__(self, name, handler, timeout, cache_ttl, process):
+        self.name = name
+        self.handler = handler
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.process = process
+        self.calls = 0
+        self.cache_hits = 0
+
+
+class _Call:
+    """One tool call in flight; answered by whichever of the worker and the
+    watchdog gets there first."""
+
+    __slots__ = ("tool", "tool_call_id", "cache_key", "callback", "station", "session",
+                 "started", "done", "future")
+
+    def __init__(self, tool, tool_call_id, cache_key, callback, station, session):
+        self.tool = tool
+        self.tool_call_id = tool_call_id
+        self.cache_key = cache_key
+        self.callback = callback
+        self.station = station
+        self.session = session
+        self.started = time.monotonic()
+        self.done = False
+        self.future = None
+
+
+class ToolCache:
+    """LRU cache whose entries also expire after a per-entry TTL."""
+
+    def __init__(self, max_entries=DEFAULT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return (True, value) for a live entry, else (False, None)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, entry[1]
+
+    def put(self, key, value, ttl: float):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class PooledClientTools(ClientTools):
+    """The SDK's ClientTools, answered by a shared `ToolExecutor` instead of
+    a per-session event loop thread."""
+
+    def __init__(self, executor, station=None, session=None):
+        # No super().__init__(): it creates a thread pool per session that
+        # would never be used. The SDK only calls start/stop/execute_tool.
+        self.tools = {}
+        self.executor = executor
+        self.station = station
+        self.session = session
+
+    def start(self):
+        pass  # no event loop; the executor's pools are shared
+
+    def stop(self):
+        pass
+
+    def register(self, tool_name, handler, is_async=False):
+        raise RuntimeError("Register tools on the ToolExecutor")
+
+    def execute_tool(self, tool_name, parameters, callback):
+        self.executor.submit(tool_name, parameters, callback, self.station, self.session)
+
+
+class ToolExecutor:
+    """Runs client tool calls on bounded pools with timeouts and caching."""
+
+    def __init__(self, workers=DEFAULT_WORKERS, processes=DEFAULT_PROCESSES,
+                 cache_size=DEFAULT_CACHE_SIZE, max_pending=None, metrics=None, event_log=None):
+        self.workers = workers
+        self.processes = processes
+        self.max_pending = max_pending or workers * 4
+        self.metrics = metrics
+        self.event_log = event_log
+        self.tools = {}
+        self.cache = ToolCache(cache_size)
+
+        self._threads = None
+        self._process_pool = None
+        self._lock = threading.Lock()
+        self._pending = 0  # submitted calls whose worker has not finished yet
+        # Watchdog: heap of (deadline, sequence, call)
+        self._deadlines = []
+        self._sequence = itertools.count()
+        self._wakeup = threading.Condition()
+        self._watchdog = None
+        self._closing = False
+
+    @classmethod
+    def from_env(cls, metrics=None, event_log=None):
+        """Executor configured by CLIENT_TOOL_* variables, or None if
+        CLIENT_TOOL_WORKERS is 0."""
+        workers = int(os.getenv("CLIENT_TOOL_WORKERS", DEFAULT_WORKERS))
+        if workers <= 0:
+            return None
+        max_pending = int(os.getenv("CLIENT_TOOL_MAX_PENDING", "0")) or None
+        return cls(
+            workers=workers,
+            processes=int(os.getenv("CLIENT_TOOL_PROCESSES", DEFAULT_PROCESSES)),
+            cache_size=int(os.getenv("CLIENT_TOOL_CACHE_SIZE", DEFAULT_CACHE_SIZE)),
+            max_pending=max_pending,
+            metrics=metrics,
+            event_log=event_log,
+        )
+
+    # Registration
+
+    def register(self, name, handler, timeout=DEFAULT_TIMEOUT_SECONDS, cache_ttl=None,
+                 process=False):
+        """Register `handler(parameters) -> result` as the tool `name`.
+
+        `cache_ttl` (seconds) marks the tool as idempotent and caches its
+        results. `process=True` runs it in the process pool; the handler
+        must then be a module-level function that can be pickled.
+        """
+        if not callable(handler):
+            raise ValueError("Handler must be callable")
+        if name in self.tools:
+            raise ValueError(f"Tool '{name}' is already registered")
+        if process and self.processes <= 0:
+            raise ValueError(f"Tool '{name}' needs a process pool; CLIENT_TOOL_PROCESSES is 0")
+        self.tools[name] = Tool(name, handler, timeout, cache_ttl, process)
+
+    def tool(self, name, **options):
+        """Decorator form of `register()`."""
+        def decorator(handler):
+            self.register(name, handler, **options)
+            return handler
+        return decorator
+
+    def client_tools(self, station=None, session=None) -> PooledClientTools:
+        """ClientTools to pass to one `Conversation`."""
+        return PooledClientTools(self, station, session)
+
+    # Execution
+
+    def submit(self, tool_name, parameters, callback, station=None, session=None):
+        """Answer a tool call through `callback`. Never blocks."""
+        parameters = dict(parameters)
+        tool_call_id = parameters.pop("tool_call_id", None)
+        tool = self.tools.get(tool_name)
+        if tool is None:
+            self._reply(callback, tool_call_id, f"Tool '{tool_name}' is not registered", True)
+            return
+
+        cache_key = None
+        if tool.cache_ttl:
+            cache_key = (tool_name, json.dumps(parameters, sort_keys=True, default=str))
+        call = _Call(tool, tool_call_id, cache_key, callback, station, session)
+
+        with self._lock:
+            tool.calls += 1
+            if cache_key is not None:
+                hit, result = self.cache.get(cache_key)
+                if hit:
+                    tool.cache_hits += 1
+            else:
+                hit = False
+            if not hit:
+                if self._pending >= self.max_pending:
+                    call.done = True
+                    busy = True
+                else:
+                    self._pending += 1
+                    busy = False
+
+        if hit:
+            call.done = True
+            self._record(call, "cache_hit")
+            self._reply(callback, tool_call_id, result, False)
+            return
+        if busy:
+            self._record(call, "rejected")
+            self._reply(callback, tool_call_id, "The device is busy; try again shortly.", True)
+            return
+
+        pool = None
+        try:
+            pool = self._pool(tool.process)
+            call.future = pool.submit(tool.handler, parameters)
+        except (BrokenExecutor, RuntimeError) as e:
+            # A process pool whose worker died, or an executor that is closed
+            with self._lock:
+                self._pending -= 1
+                if isinstance(e, BrokenExecutor):
+                    # The next call starts a new pool
+                    if pool is self._process_pool:
+                        self._process_pool = None
+                    elif pool is self._threads:
+                        self._threads = None
+            if isinstance(e, BrokenExecutor):
+                pool.shutdown(wait=False, cancel_futures=True)
+            self._finish(call, f"Tool '{tool_name}' could not be started: {e}", True, "error")
+            return
+        call.future.add_done_callback(lambda f: self._completed(call, f))
+        self._watch(call)
+
+    def _pool(self, process: bool):
+        with self._lock:
+            if self._closing:
+                raise RuntimeError("client tools are shut down")
+            if process:
+                if self._process_pool is None:
+                    # forkserver: workers are forked from a clean single-threaded
+                    # server, not from this process with its audio threads
+                    self._process_pool = ProcessPoolExecutor(
+                        max_workers=self.processes,
+                        mp_context=multiprocessing.get_context("forkserver"),
+                    )
+                return self._process_pool
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="client-tool"
+                )
+            return self._threads
+
+    def _completed(self, call, future):
+        with self._lock:
+            self._pending -= 1
+        if future.cancelled():
+            return  # timed out or closed before a worker picked it up
+        try:
+            result = future.result()
+        except Exception as e:
+            self._finish(call, f"Tool '{call.tool.name}' failed: {e}", True, "error")
+            return
+        if call.cache_key is not None:
+            self.cache.put(call.cache_key, result, call.tool.cache_ttl)
+        self._finish(call, result, False, "ok")
+
+    def _finish(self, call, result, is_error, outcome):
+        with self._lock:
+            if call.done:
+                return  # already answered by the watchdog
+            call.done = True
+        self._record(call, outcome)
+        self._reply(call.callback, call.tool_call_id, result, is_error)
+
+    def _reply(self, callback, tool_call_id, result, is_error):
+        if result is None:
+            result = "Client tool called successfully."
+        elif not isinstance(result, str):
+            result = json.dumps(result, ensure_ascii=False, default=str)
+        try:
+            callback({
+                "type": "client_tool_result",
+                "tool_call_id": tool_call_id,
+                "result": result,
+                "is_error": is_error,
+            })
+        except Exception as e:
+            # The session ended and the websocket is gone
+            print(f"Could not send client tool result: {e}")
+
+    def _record(self, call, outcome):
+        elapsed_ms = (time.monotonic() - call.started) * 1000
+        tool = call.tool
+        if self.metrics:
+            station = call.station or "client_tools"
+            self.metrics.record(station, f"tool_{tool.name}_ms", elapsed_ms)
+            self.metrics.increment(station, f"tool_{tool.name}_{outcome}")
+            if tool.cache_ttl:
+                self.metrics.set_gauge(
+                    f"client_tools.{tool.name}.hit_rate", round(tool.cache_hits / tool.calls, 3)
+                )
+        if self.event_log:
+            self.event_log.emit(
+                "client_tool", call.session, station=call.station, tool=tool.name,
+                outcome=outcome, ms=round(elapsed_ms, 1),
+            )
+
+    # Timeouts
+
+    def _watch(self, call):
+        with self._wakeup:
+            heapq.heappush(
+                self._deadlines, (call.started + call.tool.timeout, next(self._sequence), call)
+            )
+            if self._watchdog is None:
+                self._watchdog = threading.Thread(
+                    target=self._run_watchdog, name="client-tool-watchdog", daemon=True
+                )
+                self._watchdog.start()
+            self._wakeup.notify()
+
+    def _run_watchdog(self):
+        while True:
+            with self._wakeup:
+                while not self._closing:
+                    # Completed calls leave their deadline behind; skip them
+                    while self._deadlines and self._deadlines[0][2].done:
+                        heapq.heappop(self._deadlines)
+                    if not self._deadlines:
+                        self._wakeup.wait()
+                        continue
+                    wait = self._deadlines[0][0] - time.monotonic()
+                    if wait <= 0:
+                        break
+                    self._wakeup.wait(wait)
+                if self._closing:
+                    return
+                call = heapq.heappop(self._deadlines)[2]
+            self._finish(
+                call, f"Tool '{call.tool.name}' timed out after {call.tool.timeout:g} s",
+                True, "timeout",
+            )
+            # A call still queued behind busy workers must not run after the
+            # agent was told it failed; one that is running finishes anyway
+            call.future.cancel()
+
+    def close(self):
+        """Stop the watchdog and the pools without waiting for running tools."""
+        with self._wakeup:
+            self._closing = True
+            self._wakeup.notify()
+        if self._watchdog is not None:
+            self._watchdog.join()
+            self._watchdog = None
+        with self._lock:
+            pools = (self._threads, self._process_pool)
+            self._threads = self._process_pool = None
+        for pool in pools:
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        """Calls, cache hits and hit rate per tool."""
+        return {
+            name: {
+                "calls": tool.calls,
+                "cache_hits": tool.cache_hits,
+                "hit_rate": (
+                    round(tool.cache_hits / tool.calls, 3) if tool.calls and tool.cache_ttl else None
+                ),
+            }
+            for name, tool in self.tools.items()
+        }
+
+
+# Built-in tools
+
+def get_device_status(parameters: dict) -> dict:
+    """CPU temperature, load average and uptime of the device."""
+    status = {"load_average": os.getloadavg()}
+    try:
+        with open("/sys/class/thermal/thermal_zone0/temp", "r", encoding="ascii") as temp:
+            status["cpu_temperature_c"] = int(temp.read()) / 1000
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/proc/uptime", "r", encoding="ascii") as uptime:
+            status["uptime_hours"] = round(float(uptime.read().split()[0]) / 3600, 1)
+    except (OSError, ValueError, IndexError):
+        pass
+    return status
+
+
+def get_local_time(parameters: dict) -> str:
+    """Local date and time on the device, e.g. for "what time is it"."""
+    return time.strftime("%A %Y-%m-%d %H:%M")
+
+
+def register_builtin_tools(executor: ToolExecutor):
+    executor.register("get_device_status", get_device_status, timeout=2.0, cache_ttl=10)
+    executor.register("get_local_time", get_local_time, timeout=1.0)
@@ -0,0 +1,324 @@
+"""Dynamic variables for the agent prompt, refreshed in the background.
+
+Values such as the time of day or a summary of the previous conversation
+come from providers: functions that return a dict of variables. Each
+provider is refreshed on its own TTL by a background thread that hands the
+fetches to a small worker pool, so one slow provider neither delays the
+others nor the session start. After every refresh the merged variables are
+published as a new immutable snapshot; `for_session()` only reads the
+current snapshot, so starting a session never waits for a provider.
+
+Until its first refresh a provider contributes its declared defaults, so
+every variable the prompt uses is always present. A per-station provider
+returns `{station: {variable: value}}`; each session gets its own
+station's values, or the defaults for a station the provider did not
+mention. A provider counts as
+stale when it has not refreshed successfully within `stale_factor` times
+its TTL, and as slow while a fetch has been running longer than its
+timeout. Sessions that start with stale or slow providers increment
+`dynamic_vars_stale` for their station; per-provider refresh latency,
+errors and slow fetches are recorded under the `dynamic_vars` station.
+"""
+
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import transcript_store
+
+METRICS_STATION = "dynamic_vars"
+DEFAULT_TTL_SECONDS = 60.0
+DEFAULT_TIMEOUT_SECONDS = 2.0
+DEFAULT_STALE_FACTOR = 3.0
+# Providers that failed are retried after this, or their TTL if shorter
+RETRY_SECONDS = 10.0
+SUMMARY_MAX_CHARS = 400
+# A conversation's remote summary is asked for at most this often, with the
+# wait doubling from SUMMARY_RETRY_SECONDS after every miss
+SUMMARY_MAX_ATTEMPTS = 5
+SUMMARY_RETRY_SECONDS = 60.0
+
+
+class Provider:
+    """One source of variables and its refresh state."""
+
+    def __init__(self, name, fetch, defaults, ttl, timeout, per_station=False):
+        self.name = name
+        self.fetch = fetch
+        self.defaults = dict(defaults)
+        self.ttl = ttl
+        self.timeout = timeout
+        self.per_station = per_station
+        # Per-station providers: station -> variables
+        self.values = {} if per_station else dict(defaults)
+        self.updated = None  # monotonic time of the last successful refresh
+        self.next_refresh = 0.0
+        self.started = None  # set while a fetch is running
+        self.slow = False
+        self.last_error = None
+
+
+class DynamicVariables:
+    """Static variables plus providers, read as one snapshot per session."""
+
+    def __init__(self, static=None, metrics=None, workers=2, stale_factor=DEFAULT_STALE_FACTOR):
+        self.static = dict(static or {})
+        self.metrics = metrics
+        self.workers = workers
+        self.stale_factor = stale_factor
+        self.providers = {}
+
+        # Guards provider state; re-entrant because a fetch that finishes
+        # at once runs its done-callback inside submit()
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._pool = None
+        # (variables, station -> per-station variables, names of stale or
+        # slow providers); replaced, never mutated
+        self._snapshot = (dict(self.static), {}, ())
+
+    def add_provider(self, name, fetch, defaults, ttl=DEFAULT_TTL_SECONDS,
+                     timeout=DEFAULT_TIMEOUT_SECONDS, per_station=False):
+        """Register `fetch() -> dict`, refreshed every `ttl` seconds.
+
+        `defaults` must name every variable the provider returns. With
+        `per_station`, `fetch()` returns `{station: {variable: value}}`.
+        """
+        if name in self.providers:
+            raise ValueError(f"Provider '{name}' is already registered")
+        self.providers[name] = Provider(name, fetch, defaults, ttl, timeout, per_station)
+        self._publish()
+        self._wake.set()
+
+    def snapshot(self):
+        """The current (variables, per-station variables, stale provider
+        names). Never blocks."""
+        return self._snapshot
+
+    def for_session(self, station: str, **overrides) -> dict:
+        """Variables for a session at `station` starting now, plus
+        per-session overrides."""
+        variables, by_station, stale = self._snapshot
+        if stale and self.metrics:
+            self.metrics.increment(station, "dynamic_vars_stale")
+        station_values = by_station.get(station)
+        if station_values or overrides:
+            variables = {**variables, **(station_values or {}), **overrides}
+        return variables
+
+    # Background refresh
+
+    def start(self):
+        """Start refreshing; the first fetch of every provider starts now."""
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="dynamic-vars")
+        self._thread = threading.Thread(target=self._run, name="dynamic-vars", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = None
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.clear()
+            with self._lock:
+                wait = self._schedule(time.monotonic())
+            self._wake.wait(max(wait, 0.05))
+
+    def _schedule(self, now: float) -> float:
+        """Start due fetches, flag slow ones; return seconds until the next
+        thing to do."""
+        wait = DEFAULT_TTL_SECONDS
+        changed = False
+        for provider in list(self.providers.values()):
+            if provider.started is None:
+                if now >= provider.next_refresh:
+                    provider.started = now
+                    future = self._pool.submit(provider.fetch)
+                    future.add_done_callback(lambda f, p=provider: self._refreshed(p, f))
+                    wait = min(wait, provider.timeout)
+                else:
+                    wait = min(wait, provider.next_refresh - now)
+            elif not provider.slow:
+                if now - provider.started > provider.timeout:
+                    provider.slow = True
+                    changed = True
+                    if self.metrics:
+                        self.metrics.increment(METRICS_STATION, f"dynvar_{provider.name}_slow")
+                else:
+                    wait = min(wait, provider.started + provider.timeout - now)
+            if provider.updated is not None:
+                stale_at = provider.updated + provider.ttl * self.stale_factor
+                if now < stale_at:
+                    wait = min(wait, stale_at - now)
+        if changed or self._stale_names(now) != self._snapshot[2]:
+            self._publish()
+        return wait
+
+    def _refreshed(self, provider, future):
+        if future.cancelled():
+            return  # stopped before the fetch ran
+        error = future.exception()
+        with self._lock:
+            now = time.monotonic()
+            elapsed_ms = (now - provider.started) * 1000
+            if error is not None:
+                provider.last_error = str(error)
+                provider.next_refresh = now + min(provider.ttl, RETRY_SECONDS)
+            else:
+                result = future.result() or {}
+                if provider.per_station:
+                    provider.values = {
+                        station: {**provider.defaults, **values} for station, values in result.items()
+                    }
+                else:
+                    provider.values = {**provider.defaults, **result}
+                provider.updated = now
+                provider.last_error = None
+                provider.next_refresh = now + provider.ttl
+            provider.slow = False
+            provider.started = None
+            self._publish()
+        if self.metrics:
+            self.metrics.record(METRICS_STATION, f"dynvar_{provider.name}_ms", elapsed_ms)
+            if error is not None:
+                self.metrics.increment(METRICS_STATION, f"dynvar_{provider.name}_error")
+        self._wake.set()
+
+    def _stale_names(self, now: float) -> tuple:
+        return tuple(
+            name for name, provider in self.providers.items()
+            if provider.slow or provider.updated is None
+            or now - provider.updated > provider.ttl * self.stale_factor
+        )
+
+    def _publish(self):
+        with self._lock:
+            variables = dict(self.static)
+            by_station = {}
+            for provider in self.providers.values():
+                if provider.per_station:
+                    variables.update(provider.defaults)
+                    for station, values in provider.values.items():
+                        by_station.setdefault(station, {}).update(values)
+                else:
+                    variables.update(provider.values)
+            self._snapshot = (variables, by_station, self._stale_names(time.monotonic()))
+
+
+# Providers
+
+WEEKDAYS = ("måndag", "tisdag", "onsdag", "torsdag", "fredag", "lördag", "söndag")
+
+
+def time_of_day() -> dict:
+    """Local time, weekday and part of the day, in Swedish."""
+    now = time.localtime()
+    hour = now.tm_hour
+    if hour < 5:
+        part = "natt"
+    elif hour < 10:
+        part = "morgon"
+    elif hour < 12:
+        part = "förmiddag"
+    elif hour < 18:
+        part = "eftermiddag"
+    else:
+        part = "kväll"
+    return {
+        "time_of_day": part,
+        "local_time": time.strftime("%H:%M", now),
+        "weekday": WEEKDAYS[now.tm_wday],
+        "date": time.strftime("%Y-%m-%d", now),
+    }
+
+
+TIME_OF_DAY_DEFAULTS = {"time_of_day": "", "local_time": "", "weekday": "", "date": ""}
+
+
+class LastSummaryProvider:
+    """Summary of each station's latest finished conversation in the
+    transcript store, as a per-station provider.
+
+    Uses ElevenLabs' own transcript summary when the API has one; until
+    then (analysis runs after the call ends) the last turns from the local
+    store stand in. The API is asked again with a doubling wait, at most
+    SUMMARY_MAX_ATTEMPTS times per conversation.
+    """
+
+    defaults = {"last_summary": ""}
+
+    def __init__(self, store_path: str, client=None, timeout=DEFAULT_TIMEOUT_SECONDS):
+        self.store_path = store_path
+        self.client = client
+        self.timeout = timeout
+        self._connection = None
+        # conversation ID -> [summary, remote attempts left, monotonic time of the next attempt]
+        self._summaries = {}
+
+    def __call__(self) -> dict:
+        if self._connection is None:
+            self._connection = transcript_store.connect(self.store_path)
+        try:
+            # SQLite takes the bare conversation_id from the row with MAX(ended)
+            rows = self._connection.execute(
+                "SELECT station, conversation_id, MAX(ended) FROM sessions "
+                "WHERE conversation_id IS NOT NULL GROUP BY station"
+            ).fetchall()
+        except sqlite3.Error:
+            self._connection.close()
+            self._connection = None
+            raise
+        now = time.monotonic()
+        # Only the stations' latest conversations stay cached
+        self._summaries = {
+            conversation_id: self._summary(conversation_id, now)
+            for _, conversation_id, _ in rows
+        }
+        return {
+            station: {"last_summary": self._summaries[conversation_id][0]}
+            for station, conversation_id, _ in rows
+        }
+
+    def _summary(self, conversation_id: str, now: float) -> list:
+        entry = self._summaries.get(conversation_id)
+        if entry is None:
+            entry = [self._local_summary(conversation_id), SUMMARY_MAX_ATTEMPTS, now]
+        summary, attempts_left, next_attempt = entry
+        if attempts_left and now >= next_attempt:
+            remote = self._remote_summary(conversation_id)
+            if remote:
+                return [remote, 0, now]
+            attempts_left -= 1
+            delay = SUMMARY_RETRY_SECONDS * 2 ** (SUMMARY_MAX_ATTEMPTS - attempts_left - 1)
+            entry = [summary, attempts_left, now + delay]
+        return entry
+
+    def _remote_summary(self, conversation_id: str) -> str:
+        if self.client is None:
+            return ""
+        try:
+            conversation = self.client.conversational_ai.conversations.get(
+                conversation_id, request_options={"timeout_in_seconds": self.timeout}
+            )
+        except Exception:
+            return ""
+        analysis = getattr(conversation, "analysis", None)
+        return (getattr(analysis, "transcript_summary", None) or "")[:SUMMARY_MAX_CHARS]
+
+    def _local_summary(self, conversation_id: str) -> str:
+        turns = transcript_store.conversation_turns(self._connection, conversation_id)[-4:]
+        text = " / ".join(f"{role}: {line}" for _, role, line in turns)
+        return text[:SUMMARY_MAX_CHARS]
@@ -0,0 +1,341 @@
+"""Structured event log for transcripts, agent responses and session state.
+
+SDK callbacks run on the websocket thread, so they must never block on
+stdout or disk. `EventLog.emit()` only takes a sequence number from an
+`itertools.count` (atomic under the GIL) and stores a tuple in a
+preallocated ring slot; no lock is taken. A background writer drains the
+ring in batches, appends JSON lines to a size-rotated file and, optionally,
+echoes a readable line per event to stdout in one write per batch.
+
+If the writer falls more than `capacity` events behind, the oldest events
+are overwritten and counted as dropped instead of stalling the callbacks.
+
+Tail the log from the command line:
+
+    python event_log.py                         # last 20 events
+    python event_log.py -f --conversation ID    # follow one conversation
+    python event_log.py --kind user_transcript -n 100
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+DEFAULT_CAPACITY = 4096
+DEFAULT_FLUSH_SECONDS = 0.25
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+DEFAULT_BACKUPS = 5
+DEFAULT_PATH = os.path.join("logs", "events.jsonl")
+
+# How events are shown on the console when echo is enabled
+ECHO_FORMATS = {
+    "agent_response": "{prefix}Agent: {text}",
+    "agent_response_correction": "{prefix}Agent: {original} -> {corrected}",
+    "user_transcript": "{prefix}You: {text}",
+    "session_start": "{prefix}Starting ElevenLabs session...",
+    "session_end": "{prefix}Conversation ID: {conversation_id}",
+    "session_error": "{prefix}Error during conversation: {error}",
+    "session_finished": "{prefix}Session finished, cleaning up...",
+    "health_warning": "Health warning: {message}",
+    "profile_written": "Profile written to {path} ({samples} samples, {overhead_percent}% overhead)",
+}
+
+
+class EventLog:
+    """Lock-free event ring with a batching background writer."""
+
+    def __init__(self, path=None, capacity=DEFAULT_CAPACITY, flush_seconds=DEFAULT_FLUSH_SECONDS,
+                 max_bytes=DEFAULT_MAX_BYTES, backups=DEFAULT_BACKUPS, echo=True):
+        if capacity & (capacity - 1):
+            raise ValueError("capacity must be a power of two")
+        self.path = path
+        self.capacity = capacity
+        self.flush_seconds = flush_seconds
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.echo = echo
+        self.dropped = 0
+
+        self._mask = capacity - 1
+        self._ring = [None] * capacity
+        self._sequence = itertools.count()
+        self._session_sequence = itertools.count(1)
+        self._read_sequence = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._file = None
+        self._file_failed = False  # the last write to the file failed
+        self._sinks = []
+
+    @classmethod
+    def from_env(cls):
+        """Build an event log configured by EVENT_LOG_* environment variables."""
+        path = os.getenv("EVENT_LOG_PATH", DEFAULT_PATH)
+        return cls(
+            path=path or None,
+            capacity=int(os.getenv("EVENT_LOG_CAPACITY", DEFAULT_CAPACITY)),
+            max_bytes=int(os.getenv("EVENT_LOG_MAX_BYTES", DEFAULT_MAX_BYTES)),
+            backups=int(os.getenv("EVENT_LOG_BACKUPS", DEFAULT_BACKUPS)),
+            echo=os.getenv("EVENT_LOG_ECHO", "1") != "0",
+        )
+
+    def new_session(self, station: str) -> str:
+        """Return a process-unique key that tags a session's events until
+        its conversation ID is known."""
+        return f"{station}-{os.getpid()}-{next(self._session_sequence)}"
+
+    def emit(self, kind: str, session=None, **fields):
+        """Record an event. Safe to call from any thread; never blocks."""
+        sequence = next(self._sequence)
+        self._ring[sequence & self._mask] = (sequence, time.time(), kind, session, fields)
+
+    # Writer side
+
+    def start(self):
+        if self._thread is not None:
+            return
+        if self.path:
+            # Echo and sinks keep working without the file, e.g. when the
+            # working directory is not writable
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            except OSError as e:
+                print(f"Could not open event log {self.path}: {e}; continuing without it")
+        self._thread = threading.Thread(target=self._run, name="event-log", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Stop the writer after flushing everything emitted so far."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        if self._file:
+            try:
+                self._file.close()
+            except OSError:
+                pass  # already reported by _write_file()
+            self._file = None
+
+    def _drain(self) -> list:
+        batch = []
+        while True:
+            record = self._ring[self._read_sequence & self._mask]
+            if record is None or record[0] < self._read_sequence:
+                # Slot not written yet (or a producer is mid-store); try later
+                break
+            if record[0] > self._read_sequence:
+                # The ring wrapped while we were behind
+                self.dropped += record[0] - self._read_sequence
+                batch.append((None, time.time(), "events_dropped", None,
+                              {"count": record[0] - self._read_sequence}))
+                self._read_sequence = record[0]
+                continue
+            batch.append(record)
+            self._read_sequence += 1
+        return batch
+
+    def _run(self):
+        while True:
+            stopping = self._stop.wait(self.flush_seconds)
+            batch = self._drain()
+            if batch:
+                self._write(batch)
+            if stopping:
+                return
+
+    def add_sink(self, sink):
+        """Also hand every flushed batch (a list of record dicts) to `sink`.
+
+        Sinks run on the writer thread and must be quick; a sink that does
+        slow work should queue the batch for its own thread.
+        """
+        self._sinks.append(sink)
+
+    def _write(self, batch):
+        records = []
+        for _, timestamp, kind, session, fields in batch:
+            record = {"ts": round(timestamp, 3), "kind": kind}
+            if session:
+                record["session"] = session
+            record.update(fields)
+            records.append(record)
+
+        if self._file:
+            self._write_file(records)
+
+        if self.echo:
+            out = []
+            for _, _, kind, _, fields in batch:
+                template = ECHO_FORMATS.get(kind)
+                if template is None:
+                    continue
+                station = fields.get("station")
+                prefix = f"[{station}] " if station and station != "main" else ""
+                try:
+                    out.append(template.format(prefix=prefix, **fields))
+                except KeyError:
+                    out.append(f"{prefix}{kind}: {fields}")
+            if out:
+                sys.stdout.write("\n".join(out) + "\n")
+                sys.stdout.flush()
+
+        for sink in self._sinks:
+            try:
+                sink(records)
+            except Exception as e:
+                sys.stdout.write(f"Event log sink failed: {e}\n")
+
+    def _write_file(self, records):
+        """Append records to the file; a failed write (e.g. a full disk) is
+        reported once and retried with the next batch."""
+        try:
+            if self._file.closed:
+                self._file = open(self.path, "a", encoding="utf-8")
+            lines = [json.dumps(record, ensure_ascii=False) for record in records]
+            self._file.write("\n".join(lines) + "\n")
+            self._file.flush()
+            if self.max_bytes and self._file.tell() >= self.max_bytes:
+                self._rotate()
+        except (OSError, ValueError) as e:
+            if not self._file_failed:
+                sys.stdout.write(f"Could not write event log {self.path}: {e}\n")
+            self._file_failed = True
+            return
+        if self._file_failed:
+            sys.stdout.write(f"Event log {self.path} is being written again\n")
+            self._file_failed = False
+
+    def _rotate(self):
+        self._file.close()
+        for index in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+
+def _log_files(path: str) -> list:
+    """Rotated files oldest first, followed by the live file."""
+    files = []
+    index = 1
+    while os.path.exists(f"{path}.{index}"):
+        files.append(f"{path}.{index}")
+        index += 1
+    files.reverse()
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+class _ConversationFilter:
+    """Matches events by kind and by conversation ID.
+
+    Events are tagged with a session key while the session runs; the
+    conversation ID only appears in the `session_end` event. Events of
+    unresolved sessions are held back until that event arrives.
+    """
+
+    def __init__(self, conversation_id=None, kind=None):
+        self.conversation_id = conversation_id
+        self.kind = kind
+        self.pending = {}
+        self.matched_sessions = set()
+
+    def feed(self, record: dict) -> list:
+        if self.conversation_id is None:
+            return [record] if self._kind_matches(record) else []
+
+        session = record.get("session")
+        if record.get("conversation_id") == self.conversation_id:
+            if session:
+                self.matched_sessions.add(session)
+            held = self.pending.pop(session, [])
+            return [r for r in held + [record] if self._kind_matches(r)]
+        if session in self.matched_sessions:
+            return [record] if self._kind_matches(record) else []
+        if session:
+            if record.get("kind") == "session_end":
+                # A different conversation; forget its events
+                self.pending.pop(session, None)
+            else:
+                self.pending.setdefault(session, []).append(record)
+        return []
+
+    def _kind_matches(self, record: dict) -> bool:
+        return self.kind is None or record.get("kind") == self.kind
+
+
+def _format(record: dict) -> str:
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record.get("ts", 0)))
+    rest = {k: v for k, v in record.items() if k not in ("ts", "kind")}
+    return f"{timestamp} {record.get('kind')} {json.dumps(rest, ensure_ascii=False)}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tail and filter the Hanson event log.")
+    parser.add_argument("--file", default=os.getenv("EVENT_LOG_PATH") or DEFAULT_PATH)
+    parser.add_argument("--conversation", help="only events of this conversation ID")
+    parser.add_argument("--kind", help="only events of this kind, e.g. user_transcript")
+    parser.add_argument("-n", "--lines", type=int, default=20, help="events to show (0 = all)")
+    parser.add_argument("-f", "--follow", action="store_true", help="keep printing new events")
+    parser.add_argument("--json", action="store_true", help="print raw JSON lines")
+    args = parser.parse_args()
+
+    event_filter = _ConversationFilter(args.conversation, args.kind)
+    show = (lambda r: print(json.dumps(r, ensure_ascii=False))) if args.json else (lambda r: print(_format(r)))
+
+    matches = []
+    for path in _log_files(args.file):
+        with open(path, "r", encoding="utf-8") as log_file:
+            for line in log_file:
+                try:
+                    matches.extend(event_filter.feed(json.loads(line)))
+                except ValueError:
+                    continue
+    for record in matches[-args.lines:] if args.lines else matches:
+        show(record)
+
+    if not args.follow:
+        return
+
+    try:
+        log_file = open(args.file, "r", encoding="utf-8")
+        log_file.seek(0, os.SEEK_END)
+        inode = os.fstat(log_file.fileno()).st_ino
+        while True:
+            line = log_file.readline()
+            if line:
+                try:
+                    for record in event_filter.feed(json.loads(line)):
+                        show(record)
+                except ValueError:
+                    pass
+                continue
+            time.sleep(0.25)
+            # Reopen after the writer rotated the file
+            try:
+                if os.stat(args.file).st_ino != inode:
+                    log_file.close()
+                    log_file = open(args.file, "r", encoding="utf-8")
+                    inode = os.fstat(log_file.fileno()).st_ino
+            except FileNotFoundError:
+                pass
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""Background health monitor for long-running assistants.
+
+Every HEALTH_INTERVAL_SECONDS the monitor samples, from /proc and the
+standard library:
+
+- CPU usage of every thread (utime + stime from /proc/self/task/*/stat),
+- resident memory, open file descriptors and live thread count,
+- live `threading.Timer` objects (leaked LED blink timers show up here),
+- input overflow / underflow and output underflow counts from the audio
+  interfaces.
+
+The values are published as gauges on the shared `SessionMetrics` and as a
+`health` event in the event log. A `health_warning` event is emitted when
+a value crosses its threshold (once per crossing, not on every sample)
+and whenever new xruns occurred since the previous sample.
+"""
+
+import os
+import threading
+import time
+
+from audio_interface import xrun_counts
+from metrics import read_rss_kb
+
+DEFAULT_INTERVAL_SECONDS = 30
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+# Threshold name -> (environment variable, default)
+THRESHOLDS = {
+    "rss_mb": ("HEALTH_MAX_RSS_MB", 300),
+    "open_fds": ("HEALTH_MAX_FDS", 256),
+    "threads": ("HEALTH_MAX_THREADS", 64),
+    "timers": ("HEALTH_MAX_TIMERS", 4),
+    "thread_cpu_percent": ("HEALTH_MAX_THREAD_CPU_PERCENT", 80),
+}
+
+
+def read_thread_cpu_ticks() -> dict:
+    """Map native thread id -> (name, utime + stime in clock ticks)."""
+    ticks = {}
+    try:
+        task_ids = os.listdir("/proc/self/task")
+    except OSError:
+        return ticks
+    for task_id in task_ids:
+        try:
+            with open(f"/proc/self/task/{task_id}/stat", "r", encoding="ascii",
+                      errors="replace") as stat:
+                data = stat.read()
+        except OSError:
+            continue  # the thread exited meanwhile
+        # The name is in parentheses and may itself contain spaces
+        name = data[data.index("(") + 1:data.rindex(")")]
+        fields = data[data.rindex(")") + 2:].split()
+        # fields[0] is field 3 (state); utime and stime are fields 14 and 15
+        ticks[int(task_id)] = (name, int(fields[11]) + int(fields[12]))
+    return ticks
+
+
+def count_open_fds() -> int:
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return -1
+
+
+class HealthMonitor:
+    """Samples process health on a daemon thread."""
+
+    def __init__(self, metrics, event_log=None, interval=DEFAULT_INTERVAL_SECONDS, thresholds=None):
+        self.metrics = metrics
+        self.event_log = event_log
+        self.interval = interval
+        self.thresholds = thresholds or {name: default for name, (_, default) in THRESHOLDS.items()}
+        self.last_sample = None
+
+        self._previous_ticks = {}
+        self._previous_time = None
+        self._previous_xruns = None
+        self._exceeded = set()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_env(cls, metrics, event_log=None):
+        """Monitor configured by HEALTH_* variables, or None if disabled."""
+        interval = float(os.getenv("HEALTH_INTERVAL_SECONDS", DEFAULT_INTERVAL_SECONDS))
+        if interval <= 0:
+            return None
+        thresholds = {
+            name: float(os.getenv(variable, default))
+            for name, (variable, default) in THRESHOLDS.items()
+        }
+        return cls(metrics, event_log, interval, thresholds)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.sample()  # establish the CPU and xrun baselines
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="health-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"Health monitor failed to sample: {e}")
+
+    def sample(self) -> dict:
+        """Take one sample, publish it and return it."""
+        now = time.monotonic()
+        ticks = read_thread_cpu_ticks()
+        python_names = {t.native_id: t.name for t in threading.enumerate()}
+
+        thread_cpu = {}
+        if self._previous_time is not None:
+            elapsed = now - self._previous_time
+            for tid, (name, total) in ticks.items():
+                previous = self._previous_ticks.get(tid)
+                if previous is None or elapsed <= 0:
+                    continue
+                percent = 100.0 * (total - previous[1]) / CLOCK_TICKS / elapsed
+                label = python_names.get(tid, name)
+                thread_cpu[f"{label}[{tid}]"] = round(percent, 1)
+        self._previous_ticks = ticks
+        self._previous_time = now
+
+        xruns = xrun_counts()
+        new_xruns = {}
+        if self._previous_xruns is not None:
+            new_xruns = {
+                kind: count - self._previous_xruns[kind]
+                for kind, count in xruns.items()
+                if count > self._previous_xruns[kind]
+            }
+        self._previous_xruns = xruns
+
+        live_threads = threading.enumerate()
+        sample = {
+            "rss_mb": round(read_rss_kb() / 1024, 1),
+            "open_fds": count_open_fds(),
+            "threads": len(live_threads),
+            "native_threads": len(ticks),
+            "timers": sum(1 for t in live_threads if isinstance(t, threading.Timer)),
+            "thread_cpu_percent": max(thread_cpu.values(), default=0.0),
+            "xruns": xruns,
+        }
+        self.last_sample = dict(sample, thread_cpu=thread_cpu)
+
+        for name, value in sample.items():
+            if name == "xruns":
+                for kind, count in value.items():
+                    self.metrics.set_gauge(f"health.{kind}", count)
+            else:
+                self.metrics.set_gauge(f"health.{name}", value)
+
+        if self.event_log:
+            self.event_log.emit("health", **self.last_sample)
+        self._check(sample, thread_cpu, new_xruns)
+        return self.last_sample
+
+    def _check(self, sample, thread_cpu, new_xruns):
+        for name, limit in self.thresholds.items():
+            value = sample[name]
+            if value > limit and name not in self._exceeded:
+                self._exceeded.add(name)
+                detail = ""
+                if name == "thread_cpu_percent":
+                    busiest = max(thread_cpu, key=thread_cpu.get)
+                    detail = f" ({busiest})"
+                self._warn(f"{name} is {value}{detail}, above {limit:g}")
+            elif value <= limit and name in self._exceeded:
+                self._exceeded.discard(name)
+        if new_xruns:
+            parts = ", ".join(f"{count} {kind}" for kind, count in sorted(new_xruns.items()))
+            self._warn(f"audio xruns since last sample: {parts}")
+
+    def _warn(self, message: str):
+        if self.event_log:
+            self.event_log.emit("health_warning", message=message)
+        else:
+            print(f"Health warning: {message}")
@@ -11,6 +11,24 @@ import time
 from dotenv import load_dotenv
 import pyaudio
 
+from barge_in import BargeInDetector
+from client_tools import ToolExecutor, register_builtin_tools
+from dynamic_variables import (
+    TIME_OF_DAY_DEFAULTS,
+    DynamicVariables,
+    LastSummaryProvider,
+    time_of_day,
+)
+from event_log import EventLog
+from led_meter import LedMeter, pwm_driver
+from health_monitor import HealthMonitor
+from metrics import SessionMetrics
+from profiler import SamplingProfiler
+import scheduling
+from scheduling import Scheduler
+from session_recorder import RecordingManager
+from transcript_store import TranscriptStore
+
 # Suppress ALSA warnings/errors before importing audio libraries
 os.environ['ALSA_CARD'] = 'default'
 os.environ['ALSA_PCM_CARD'] = 'default'
@@ -27,7 +45,7 @@ try:
         Conversation,
         ConversationInitiationData,
     )
-    from elevenlabs.conversational_ai.default_audio_interface import DefaultAudioInterface
+    from audio_interface import StationAudioInterface, load_profile, resolve_device
 finally:
     # Restore stderr
     os.dup2(old_stderr, stderr_fd)
@@ -88,12 +106,25 @@ except ValueError:
     STATUS_LED_PIN = None
 
 STATUS_LED_ACTIVE_HIGH = os.getenv("STATUS_LED_ACTIVE_HIGH", "1") != "0"
+# "onoff", or "level" for brightness that follows the agent's voice
+STATUS_LED_MODE = os.getenv("STATUS_LED_MODE", "onoff")
 thinking_blink_env = os.getenv("THINKING_BLINK_SECONDS", "0.05")
 try:
     THINKING_BLINK_SECONDS = float(thinking_blink_env)
 except ValueError:
     THINKING_BLINK_SECONDS = 0.05
 
+# Pause after each session before accepting the next button press
+SESSION_COOLDOWN_SECONDS = 1.0
+
+# Capture channels to open and the one to use; with the 6-channel ReSpeaker
+# firmware, channel 0 is the echo-cancelled signal
+INPUT_CHANNELS = int(os.getenv("INPUT_CHANNELS", "1"))
+INPUT_CHANNEL = int(os.getenv("INPUT_CHANNEL", "0"))
+# Device index or name fragment (e.g. "ReSpeaker"); empty for the system default
+INPUT_DEVICE = os.getenv("INPUT_DEVICE", "")
+OUTPUT_DEVICE = os.getenv("OUTPUT_DEVICE", "")
+
 agent_id = os.getenv("ELEVENLABS_AGENT_ID")
 api_key = os.getenv("ELEVENLABS_API_KEY")
 
@@ -104,33 +135,71 @@ if not api_key:
 
 elevenlabs = ElevenLabs(api_key=api_key)
 
-# Dynamic variables that can be used in your agent prompt
+# Dynamic variables that can be used in your agent prompt; the providers
+# registered below add live values such as {{time_of_day}} and {{room}}
 dynamic_vars = {
     "user_name": "Fredrik",
     "greeting": "Hej",
     "language": "svenska",
 }
-
-config = ConversationInitiationData(dynamic_variables=dynamic_vars)
+# Value of {{room}}; defaults to the station name
+ROOM_NAME = os.getenv("ROOM_NAME", "")
+
+# Latency samples and process usage, shared with the multi-station daemon
+session_metrics = SessionMetrics()
+DEFAULT_STATION = "main"
+# PyAudio instance reused by every session; None opens one per session
+shared_audio = None
+
+# Transcripts and session events go through the event log instead of print()
+event_log = EventLog.from_env()
+# Searchable history of past conversations, fed by the event log writer
+transcript_store = TranscriptStore.from_env()
+if transcript_store:
+    event_log.add_sink(transcript_store.handle_events)
+# Provider values are refreshed in the background; sessions read a snapshot
+dynamic_variables = DynamicVariables(dynamic_vars, session_metrics)
+dynamic_variables.add_provider("time_of_day", time_of_day, TIME_OF_DAY_DEFAULTS, ttl=20)
+if transcript_store:
+    dynamic_variables.add_provider(
+        "last_summary", LastSummaryProvider(transcript_store.path, elevenlabs),
+        LastSummaryProvider.defaults, ttl=60, timeout=5, per_station=True,
+    )
+# Optional recording of session audio (enabled by RECORDING_DIR)
+recordings = RecordingManager.from_env()
+# Opt-in stack sampling (PROFILE_SESSIONS=1 or SIGUSR1)
+profiler = SamplingProfiler.from_env(event_log)
+# Periodic RSS/fd/thread/xrun sampling (HEALTH_INTERVAL_SECONDS=0 disables)
+health_monitor = HealthMonitor.from_env(session_metrics, event_log)
+# Tools the agent can call on the device (CLIENT_TOOL_WORKERS=0 disables)
+client_tool_executor = ToolExecutor.from_env(session_metrics, event_log)
+if client_tool_executor:
+    register_builtin_tools(client_tool_executor)
+# CPU affinity and priority per thread role (SCHED_<ROLE>_* variables)
+scheduler = Scheduler.from_env(event_log)
 
 STATUS_LED_INITIALIZED = False
+status_led_meter = None  # LedMeter when STATUS_LED_MODE=level
 THINKING_TIMER = None
+# Redirecting fd 2 is process-wide; stations in one process must take turns
+STDERR_REDIRECT_LOCK = threading.RLock()
 
 
 def suppress_alsa_errors(func):
     """Decorator to suppress ALSA errors during function execution."""
     def wrapper(*args, **kwargs):
-        stderr_fd = sys.stderr.fileno()
-        old_stderr = os.dup(stderr_fd)
-        devnull_fd = os.open(os.devnull, os.O_WRONLY)
-        os.dup2(devnull_fd, stderr_fd)
-        
-        try:
-            return func(*args, **kwargs)
-        finally:
-            os.dup2(old_stderr, stderr_fd)
-            os.close(devnull_fd)
-            os.close(old_stderr)
+        with STDERR_REDIRECT_LOCK:
+            stderr_fd = sys.stderr.fileno()
+            old_stderr = os.dup(stderr_fd)
+            devnull_fd = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull_fd, stderr_fd)
+
+            try:
+                return func(*args, **kwargs)
+            finally:
+                os.dup2(old_stderr, stderr_fd)
+                os.close(devnull_fd)
+                os.close(old_stderr)
     
     return wrapper
 
@@ -181,7 +250,7 @@ def _get_or_open_gpiochip():
 def setup_status_led():
     """Initialize status LED via GPIO if a pin is provided."""
 
-    global STATUS_LED_INITIALIZED, gpiod_chip, gpiod_led_line
+    global STATUS_LED_INITIALIZED, gpiod_chip, gpiod_led_line, status_led_meter
 
     if not GPIO_AVAILABLE or STATUS_LED_PIN is None:
         return
@@ -222,6 +291,34 @@ def setup_status_led():
         )
         print(f"Details: {e}")
         print("Continuing without status LED. Button functionality may still work.")
+        return
+
+    status_led_meter = create_led_meter(STATUS_LED_PIN, STATUS_LED_ACTIVE_HIGH, gpiod_led_line)
+
+
+def create_led_meter(pin, active_high, line=None, allow_sysfs=True):
+    """Audio-reactive LedMeter for an initialized LED, or None if
+    STATUS_LED_MODE is not "level" or PWM is unavailable."""
+
+    if STATUS_LED_MODE != "level":
+        return None
+    kind = os.getenv("LED_PWM", "auto")
+    if kind == "sysfs" and not allow_sysfs:
+        kind = "auto"  # one PWM channel cannot serve several LEDs
+    try:
+        driver = pwm_driver(
+            kind, GPIO_BACKEND, pin, active_high,
+            GPIO=GPIO if GPIO_BACKEND == 'RPi.GPIO' else None,
+            line=line,
+            chip=int(os.getenv("LED_PWM_CHIP", "0")),
+            channel=int(os.getenv("LED_PWM_CHANNEL", "0")),
+        )
+    except (ValueError, RuntimeError, OSError) as e:
+        print(f"Could not set up PWM for the LED on GPIO {pin}; keeping it on/off: {e}")
+        return None
+    meter = LedMeter.from_env(driver)
+    meter.start()
+    return meter
 
 
 def set_status_led(active: bool):
@@ -229,6 +326,9 @@ def set_status_led(active: bool):
 
     if not STATUS_LED_INITIALIZED:
         return
+    if status_led_meter:
+        status_led_meter.set_base(active)
+        return
 
     try:
         if GPIO_BACKEND == 'gpiod':
@@ -321,45 +421,126 @@ def validate_audio_environment() -> bool:
 
 
 @suppress_alsa_errors
-def create_conversation():
-    """Create a new ElevenLabs conversation."""
+def create_conversation(audio_interface=None, station=DEFAULT_STATION,
+                        on_speaking=None, on_thinking=None, session=None, room=None):
+    """Create a new ElevenLabs conversation.
+
+    Stations in multi-station mode pass their own audio interface and LED
+    callbacks; by default the module-level LED and default devices are used.
+    `session` is the event log key that tags this conversation's events.
+    """
+
+    config = ConversationInitiationData(
+        dynamic_variables=dynamic_variables.for_session(
+            station, room=room or ROOM_NAME or station
+        )
+    )
+
+    on_speaking = on_speaking or ring_speaking
+    on_thinking = on_thinking or ring_thinking
+    # Monotonic time of the last user transcript, used for response latency
+    last_transcript_at = [None]
+
+    def record_response_latency():
+        if last_transcript_at[0] is not None:
+            session_metrics.record(
+                station, "response_ms", (time.monotonic() - last_transcript_at[0]) * 1000
+            )
+            last_transcript_at[0] = None
 
     def on_agent_response(response: str):
-        print(f"Agent: {response}")
-        ring_speaking()
+        record_response_latency()
+        event_log.emit("agent_response", session, station=station, text=response)
+        on_speaking()
 
     def on_agent_response_correction(original: str, corrected: str):
-        print(f"Agent: {original} -> {corrected}")
-        ring_speaking()
+        event_log.emit(
+            "agent_response_correction", session, station=station,
+            original=original, corrected=corrected,
+        )
+        on_speaking()
 
     def on_user_transcript(transcript: str):
-        print(f"You: {transcript}")
-        ring_thinking()
+        last_transcript_at[0] = time.monotonic()
+        event_log.emit("user_transcript", session, station=station, text=transcript)
+        on_thinking()
+
+    def on_latency_measurement(latency: int):
+        session_metrics.record(station, "sdk_latency_ms", latency)
 
     return Conversation(
         elevenlabs,
         agent_id,
         config=config,
         requires_auth=bool(api_key),
-        audio_interface=DefaultAudioInterface(),
+        client_tools=(
+            client_tool_executor.client_tools(station, session) if client_tool_executor else None
+        ),
+        audio_interface=audio_interface or StationAudioInterface(
+            audio=shared_audio, input_channels=INPUT_CHANNELS, input_channel=INPUT_CHANNEL
+        ),
         callback_agent_response=on_agent_response,
         callback_agent_response_correction=on_agent_response_correction,
         callback_user_transcript=on_user_transcript,
+        callback_latency_measurement=on_latency_measurement,
     )
 
 
+def configured_devices():
+    """(input, output) device indexes for INPUT_DEVICE and OUTPUT_DEVICE,
+    None for the defaults. Raises ValueError if a device is missing."""
+
+    if not (INPUT_DEVICE or OUTPUT_DEVICE):
+        return None, None
+    audio = shared_audio or suppress_alsa_errors(pyaudio.PyAudio)()
+    try:
+        return (
+            resolve_device(audio, INPUT_DEVICE, True),
+            resolve_device(audio, OUTPUT_DEVICE, False),
+        )
+    finally:
+        if audio is not shared_audio:
+            audio.terminate()
+
+
 def start_conversation_flow():
     """Start an ElevenLabs session and handle cleanup."""
 
-    print("Starting ElevenLabs session...")
+    session = event_log.new_session(DEFAULT_STATION)
+    event_log.emit("session_start", session, station=DEFAULT_STATION)
+    profiler.session_started(session)
     ring_listening()
+    pressed_at = time.monotonic()
+    recording = None
+    conversation_id = None
 
     try:
         if not validate_audio_environment():
             print("Audio setup is incomplete; skipping session start.")
             return
+        try:
+            input_index, output_index = configured_devices()
+        except ValueError as e:
+            print(f"{e}; skipping session start.")
+            return
 
-        conversation = create_conversation()
+        audio_interface = StationAudioInterface(
+            input_device_index=input_index,
+            output_device_index=output_index,
+            audio=shared_audio,
+            input_channels=INPUT_CHANNELS,
+            input_channel=INPUT_CHANNEL,
+        )
+        barge_in = BargeInDetector.from_env(session_metrics, event_log, DEFAULT_STATION, session)
+        if barge_in:
+            barge_in.attach(audio_interface)
+        if status_led_meter:
+            status_led_meter.attach(audio_interface)
+        if recordings:
+            recording = recordings.start_recording(session)
+            if recording:
+                recording.attach(audio_interface)
+        conversation = create_conversation(audio_interface=audio_interface, session=session)
         
         # Suppress ALSA errors during audio stream initialization
         stderr_fd = sys.stderr.fileno()
@@ -374,6 +555,11 @@ def start_conversation_flow():
             os.close(devnull_fd)
             os.close(old_stderr)
 
+        session_metrics.increment(DEFAULT_STATION, "sessions")
+        session_metrics.record(
+            DEFAULT_STATION, "session_start_ms", (time.monotonic() - pressed_at) * 1000
+        )
+
         def signal_handler(sig, frame):
             print("Cancelling session...")
             try:
@@ -384,20 +570,25 @@ def start_conversation_flow():
         signal.signal(signal.SIGINT, signal_handler)
 
         conversation_id = conversation.wait_for_session_end()
-        print(f"Conversation ID: {conversation_id}")
+        event_log.emit(
+            "session_end", session, station=DEFAULT_STATION, conversation_id=conversation_id
+        )
 
     except Exception as e:
         error_text = str(e)
-        print(f"Error during conversation: {error_text}")
+        event_log.emit("session_error", session, station=DEFAULT_STATION, error=error_text)
         if "needs_authorization" in error_text or "authorization" in error_text:
             print(
                 "Check that ELEVENLABS_API_KEY is correctly set and that the key "
                 "has permission for the selected agent ID."
             )
     finally:
-        print("Session finished, cleaning up...")
+        if recording:
+            recording.finish(conversation_id)
+        profiler.session_finished(session, conversation_id)
+        event_log.emit("session_finished", session, station=DEFAULT_STATION)
         ring_idle()
-        time.sleep(1)
+        time.sleep(SESSION_COOLDOWN_SECONDS)
 
 
 def manual_conversation_prompt():
@@ -498,22 +689,62 @@ def setup_button() -> bool:
         return False
 
 
-def main():
-    ring_idle()
+def start_background_threads():
+    """Start the recorder, transcript store, event log, dynamic variable
+    refresh and health monitor."""
+    if recordings:
+        try:
+            recordings.start()
+        except OSError as e:
+            print(f"Could not use recording directory {recordings.directory}: {e}")
+    if transcript_store:
+        try:
+            transcript_store.start()
+        except Exception as e:
+            print(f"Could not open transcript database {transcript_store.path}: {e}")
+    event_log.start()
+    dynamic_variables.start()
+    if health_monitor:
+        health_monitor.start()
+
+
+def stop_background_threads():
+    """Flush and stop the background threads; the event log before the
+    transcript store since it feeds the store."""
+    if health_monitor:
+        health_monitor.stop()
+    if client_tool_executor:
+        client_tool_executor.close()
+    dynamic_variables.stop()
+    event_log.close()
+    if transcript_store:
+        transcript_store.close()
+    if recordings:
+        recordings.close()
 
-    if not GPIO_AVAILABLE:
-        if GPIO_IMPORT_ERROR:
-            print("\nGPIO module was found but could not be imported.")
-            print(f"Error details: {GPIO_IMPORT_ERROR}")
-            print("\nThis may indicate a permissions or installation issue.")
-            print("See GPIO_PERMISSIONS.md for troubleshooting steps.")
-        else:
-            print("\nNo GPIO module is installed.")
-            print("This is expected on non-Raspberry Pi systems.")
-        manual_conversation_prompt()
-        return
 
+def main():
+    ring_idle()
+    load_profile()
+    scheduling.install(scheduler)
+    # The finally below flushes and stops the background threads on every
+    # way out of main(), manual mode included
     try:
+        start_background_threads()
+        profiler.install_signal_handler()
+
+        if not GPIO_AVAILABLE:
+            if GPIO_IMPORT_ERROR:
+                print("\nGPIO module was found but could not be imported.")
+                print(f"Error details: {GPIO_IMPORT_ERROR}")
+                print("\nThis may indicate a permissions or installation issue.")
+                print("See GPIO_PERMISSIONS.md for troubleshooting steps.")
+            else:
+                print("\nNo GPIO module is installed.")
+                print("This is expected on non-Raspberry Pi systems.")
+            manual_conversation_prompt()
+            return
+
         print(f"Using GPIO backend: {GPIO_BACKEND}")
         print("Using GPIO LED if configured; otherwise running without light.")
 
@@ -550,6 +781,7 @@ def main():
             
             def poll_button():
                 import gpiod
+                scheduling.apply("button")
                 last_debounce_time = 0
                 debounce_delay = 0.3  # 300ms debounce
                 
@@ -571,6 +803,8 @@ def main():
         else:  # RPi.GPIO
             def button_callback(channel):
                 """Callback for button press detection."""
+                # RPi.GPIO's callback thread is not ours; schedule it from here
+                scheduling.apply("button")
                 button_event.set()
 
             try:
@@ -594,6 +828,9 @@ def main():
         print("Avslutar via CTRL+C...")
     finally:
         ring_idle()
+        stop_background_threads()
+        if status_led_meter:
+            status_led_meter.stop()
         if GPIO_AVAILABLE:
             if GPIO_BACKEND == 'gpiod':
                 # Signal polling thread to stop
@@ -0,0 +1,288 @@
+"""Audio-reactive status LED.
+
+With STATUS_LED_MODE=level the status LED follows the loudness of the
+agent's voice while audio is actually being played, so a silent or stuck
+agent is visible at a glance. Outside playback it shows the usual on/off
+state from `set_status_led()`.
+
+The metering runs as an output tap on the audio interface: one vectorized
+NumPy pass turns each chunk into one RMS level per LED frame
+(LED_METER_HZ, at most 50 per second) and stores the result with the time
+the chunk starts playing. That is all the audio thread does; a separate
+LED thread picks the level for the current moment, quantizes it and only
+writes to the GPIO when the brightness changes. Every GPIO write happens
+on that one thread, at the capped rate (except with `soft`, below).
+
+Brightness is driven on the status pin according to LED_PWM:
+
+- `rpigpio`: RPi.GPIO's PWM (timed in C, works on any pin),
+- `sysfs`: hardware PWM through /sys/class/pwm (LED_PWM_CHIP,
+  LED_PWM_CHANNEL; needs a PWM overlay such as `dtoverlay=pwm` and a pin
+  that has a PWM function, e.g. GPIO 12, 13, 18 or 19),
+- `onoff`: no PWM; a gpiod line is switched on while the level is above
+  half brightness, so it flickers with the voice at LED_METER_HZ at most,
+- `soft`: a software PWM thread toggling a gpiod line (about 200 writes
+  per second from Python while dimmed; only for pins without hardware PWM
+  when real dimming is wanted),
+- `auto` (default): `rpigpio` with RPi.GPIO, `onoff` with gpiod.
+"""
+
+import os
+import threading
+import time
+
+import numpy as np
+
+import scheduling
+from audio_interface import SAMPLE_RATE
+from barge_in import FULL_SCALE_ENERGY, frame_energies
+
+DEFAULT_RATE_HZ = 30
+MAX_RATE_HZ = 50
+DEFAULT_FLOOR_DB = -50.0  # dBFS shown as off
+DEFAULT_CEILING_DB = -10.0  # dBFS shown as full brightness
+BRIGHTNESS_STEPS = 32
+# Keep the last level this long between chunks before falling back to the base state
+HOLD_SECONDS = 0.15
+SYSFS_EXPORT_TIMEOUT = 2.0
+ONOFF_THRESHOLD = 0.5  # brightness at which an on/off LED turns on
+
+
+class RPiGPIOPWM:
+    """Brightness through RPi.GPIO's PWM on an output pin."""
+
+    def __init__(self, GPIO, pin, active_high=True, frequency=200):
+        self.active_high = active_high
+        self.pwm = GPIO.PWM(pin, frequency)
+        self.pwm.start(0 if active_high else 100)
+
+    def set(self, duty: float):
+        self.pwm.ChangeDutyCycle(100 * (duty if self.active_high else 1 - duty))
+
+    def close(self):
+        self.pwm.stop()
+
+
+class SysfsPWM:
+    """Hardware PWM through the kernel's sysfs interface."""
+
+    def __init__(self, chip=0, channel=0, active_high=True, frequency=1000):
+        self.active_high = active_high
+        base = f"/sys/class/pwm/pwmchip{chip}"
+        self.path = f"{base}/pwm{channel}"
+        if not os.path.isdir(self.path):
+            self._write(f"{base}/export", channel)
+            # udev may need a moment to make the new files writable
+            deadline = time.monotonic() + SYSFS_EXPORT_TIMEOUT
+            while not os.access(f"{self.path}/duty_cycle", os.W_OK):
+                if time.monotonic() > deadline:
+                    raise OSError(f"{self.path} did not appear after export")
+                time.sleep(0.05)
+        self.period_ns = int(1e9 / frequency)
+        # The duty cycle may never exceed the period, even transiently
+        self._write(f"{self.path}/duty_cycle", 0)
+        self._write(f"{self.path}/period", self.period_ns)
+        self._duty_fd = os.open(f"{self.path}/duty_cycle", os.O_WRONLY)
+        self.set(0.0)
+        self._write(f"{self.path}/enable", 1)
+
+    @staticmethod
+    def _write(path, value):
+        with open(path, "w", encoding="ascii") as attribute:
+            attribute.write(str(value))
+
+    def set(self, duty: float):
+        level = duty if self.active_high else 1 - duty
+        # Writing at offset 0 of a kept-open fd avoids an open/close per update
+        os.pwrite(self._duty_fd, str(int(level * self.period_ns)).encode(), 0)
+
+    def close(self):
+        self.set(0.0)
+        os.close(self._duty_fd)
+        self._write(f"{self.path}/enable", 0)
+
+
+class OnOffLED:
+    """A digital output without PWM: on at or above `threshold`, written only
+    when that changes."""
+
+    def __init__(self, set_value, active_high=True, threshold=ONOFF_THRESHOLD):
+        self.set_value = set_value
+        self.active_high = active_high
+        self.threshold = threshold
+        self.on = None
+
+    def set(self, duty: float):
+        on = duty >= self.threshold
+        if on != self.on:
+            self.set_value(1 if on == self.active_high else 0)
+            self.on = on
+
+    def close(self):
+        self.set(0.0)
+
+
+class SoftPWM:
+    """Software PWM on a digital output, e.g. a gpiod line's set_value."""
+
+    def __init__(self, set_value, active_high=True, frequency=100):
+        self.set_value = set_value
+        self.active_high = active_high
+        self.period = 1.0 / frequency
+        self.duty = 0.0
+        self._wake = threading.Event()
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name="led-soft-pwm", daemon=True)
+        self._thread.start()
+
+    def set(self, duty: float):
+        self.duty = duty
+        self._wake.set()
+
+    def _write(self, on: bool):
+        self.set_value(1 if on == self.active_high else 0)
+
+    def _run(self):
+        scheduling.apply("led")
+        static = None
+        while not self._stop:
+            duty = self.duty
+            if duty <= 0.0 or duty >= 1.0:
+                # Fully off or on: write once and sleep until the duty changes
+                if static != duty:
+                    self._write(duty >= 1.0)
+                    static = duty
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            static = None
+            self._write(True)
+            time.sleep(duty * self.period)
+            self._write(False)
+            time.sleep((1.0 - duty) * self.period)
+
+    def close(self):
+        self._stop = True
+        self._wake.set()
+        self._thread.join()
+        self._write(False)
+
+
+def pwm_driver(kind, gpio_backend, pin, active_high=True, GPIO=None, line=None,
+               chip=0, channel=0, frequency=None):
+    """Create the brightness driver for `kind` (auto, rpigpio, sysfs, onoff or soft)."""
+    if kind == "auto":
+        kind = "rpigpio" if gpio_backend == "RPi.GPIO" else "onoff"
+    if kind == "rpigpio":
+        if GPIO is None:
+            raise ValueError("LED_PWM=rpigpio needs the RPi.GPIO backend")
+        return RPiGPIOPWM(GPIO, pin, active_high, frequency or 200)
+    if kind == "sysfs":
+        return SysfsPWM(chip, channel, active_high, frequency or 1000)
+    if kind == "onoff":
+        if line is None:
+            raise ValueError("LED_PWM=onoff needs a gpiod line")
+        return OnOffLED(line.set_value, active_high)
+    if kind == "soft":
+        if line is None:
+            raise ValueError("LED_PWM=soft needs a gpiod line")
+        return SoftPWM(line.set_value, active_high, frequency or 100)
+    raise ValueError(f"Unknown LED_PWM mode '{kind}'")
+
+
+class LedMeter:
+    """Drives an LED's brightness from the level of the audio being played."""
+
+    def __init__(self, driver, rate_hz=DEFAULT_RATE_HZ, floor_db=DEFAULT_FLOOR_DB,
+                 ceiling_db=DEFAULT_CEILING_DB):
+        self.driver = driver
+        self.rate_hz = min(float(rate_hz), MAX_RATE_HZ)
+        self.block_samples = int(SAMPLE_RATE / self.rate_hz)
+        self.floor_db = floor_db
+        self.span_db = ceiling_db - floor_db
+        self.base = 0.0  # brightness outside playback, set by set_base()
+        self.writes = 0
+
+        # (monotonic start time, brightness per LED frame); replaced, never mutated
+        self._envelope = None
+        self._wake = threading.Event()
+        self._stop = False
+        self._thread = None
+
+    @classmethod
+    def from_env(cls, driver):
+        return cls(
+            driver,
+            rate_hz=float(os.getenv("LED_METER_HZ", DEFAULT_RATE_HZ)),
+            floor_db=float(os.getenv("LED_METER_FLOOR_DB", DEFAULT_FLOOR_DB)),
+            ceiling_db=float(os.getenv("LED_METER_CEILING_DB", DEFAULT_CEILING_DB)),
+        )
+
+    def attach(self, audio_interface):
+        """Meter the interface's output chunks."""
+        audio_interface.output_taps.append(self.meter)
+
+    def set_base(self, active: bool):
+        """On/off state shown when no audio is playing."""
+        self.base = 1.0 if active else 0.0
+        self._wake.set()
+
+    def levels(self, chunk: bytes) -> np.ndarray:
+        """Brightness 0..1 for each LED frame of a 16-bit PCM chunk."""
+        energies = frame_energies(chunk, self.block_samples)
+        if not len(energies):
+            energies = frame_energies(chunk, max(1, len(chunk) // 2))
+        db = 10 * np.log10(energies / FULL_SCALE_ENERGY + 1e-12)
+        return np.clip((db - self.floor_db) / self.span_db, 0.0, 1.0)
+
+    def meter(self, chunk: bytes):
+        """Output tap: runs on the audio output thread right before playback."""
+        self._envelope = (time.monotonic(), self.levels(chunk))
+        self._wake.set()
+
+    # LED thread
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name="led-meter", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop = True
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+        self.driver.close()
+
+    def _run(self):
+        scheduling.apply("led")
+        period = 1.0 / self.rate_hz
+        written = None
+        while not self._stop:
+            self._wake.clear()
+            brightness, wait = self._current(time.monotonic(), written)
+            brightness = round(brightness * BRIGHTNESS_STEPS) / BRIGHTNESS_STEPS
+            if brightness != written:
+                try:
+                    self.driver.set(brightness)
+                except (RuntimeError, OSError) as e:
+                    print(f"Could not set LED brightness: {e}")
+                written = brightness
+                self.writes += 1
+            self._wake.wait(period if wait else None)
+
+    def _current(self, now: float, written):
+        """(brightness, keep polling) for the moment `now`."""
+        envelope = self._envelope
+        if envelope is not None:
+            started, levels = envelope
+            index = int((now - started) * self.rate_hz)
+            if index < len(levels):
+                return float(levels[index]), True
+            if index < len(levels) + HOLD_SECONDS * self.rate_hz and written is not None:
+                return written, True
+        return self.base, False
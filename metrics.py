@@ -0,0 +1,124 @@
+"""Session metrics shared by the single-station script and the station daemon.
+
+Latency samples are kept per station in small bounded windows so that a
+daemon running for weeks never grows its memory. Process-wide CPU and RSS
+are read on demand from the standard library and /proc.
+"""
+
+import collections
+import resource
+import threading
+import time
+
+MAX_SAMPLES = 500
+
+
+def _percentile(sorted_values, fraction):
+    """Return the value at `fraction` (0..1) of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def read_rss_kb() -> int:
+    """Resident set size of this process in kB (0 if /proc is unavailable)."""
+    try:
+        with open("/proc/self/status", "r", encoding="ascii") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    # Fall back to the peak RSS, which is what getrusage reports on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class SessionMetrics:
+    """Thread-safe latency samples keyed by station and metric name."""
+
+    def __init__(self, max_samples: int = MAX_SAMPLES):
+        self._lock = threading.Lock()
+        self._max_samples = max_samples
+        self._samples = {}
+        self._counters = collections.Counter()
+        self._gauges = {}
+        self._cpu_mark = (time.monotonic(), self._cpu_seconds())
+
+    @staticmethod
+    def _cpu_seconds() -> float:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_utime + usage.ru_stime
+
+    def record(self, station: str, name: str, value_ms: float):
+        """Add one latency sample (milliseconds) for a station."""
+        with self._lock:
+            key = (station, name)
+            window = self._samples.get(key)
+            if window is None:
+                window = self._samples[key] = collections.deque(maxlen=self._max_samples)
+            window.append(float(value_ms))
+
+    def increment(self, station: str, name: str, amount: int = 1):
+        """Increase a per-station counter, e.g. sessions started."""
+        with self._lock:
+            self._counters[(station, name)] += amount
+
+    def set_gauge(self, name: str, value):
+        """Publish a process-wide value such as RSS or thread count."""
+        with self._lock:
+            self._gauges[name] = value
+
+    def process_usage(self) -> dict:
+        """CPU usage since the previous call plus current RSS and thread count."""
+        now = time.monotonic()
+        cpu = self._cpu_seconds()
+        with self._lock:
+            last_time, last_cpu = self._cpu_mark
+            self._cpu_mark = (now, cpu)
+        elapsed = now - last_time
+        return {
+            "cpu_seconds": round(cpu, 3),
+            "cpu_percent": round(100.0 * (cpu - last_cpu) / elapsed, 1) if elapsed > 0 else 0.0,
+            "rss_kb": read_rss_kb(),
+            "threads": threading.active_count(),
+        }
+
+    def summary(self) -> dict:
+        """Snapshot of all stations' latencies, counters and process gauges."""
+        with self._lock:
+            samples = {key: sorted(window) for key, window in self._samples.items()}
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+
+        stations = {}
+        for (station, name), values in samples.items():
+            stations.setdefault(station, {})[name] = {
+                "count": len(values),
+                "p50": _percentile(values, 0.50),
+                "p95": _percentile(values, 0.95),
+                "max": values[-1] if values else None,
+            }
+        for (station, name), value in counters.items():
+            stations.setdefault(station, {})[name] = value
+
+        return {"stations": stations, "process": self.process_usage(), "gauges": gauges}
+
+    def print_report(self):
+        """Print a compact human readable report of `summary()`."""
+        summary = self.summary()
+        process = summary["process"]
+        print(
+            f"[metrics] CPU {process['cpu_percent']}% ({process['cpu_seconds']} s total), "
+            f"RSS {process['rss_kb'] / 1024:.1f} MB, threads {process['threads']}"
+        )
+        for station, values in sorted(summary["stations"].items()):
+            parts = []
+            for name, value in sorted(values.items()):
+                if isinstance(value, dict):
+                    parts.append(f"{name} p50={value['p50']:.0f}ms p95={value['p95']:.0f}ms (n={value['count']})")
+                else:
+                    parts.append(f"{name}={value}")
+            print(f"[metrics] {station}: " + ", ".join(parts))
+        for name, value in sorted(summary["gauges"].items()):
+            print(f"[metrics] {name}={value}")
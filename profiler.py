@@ -0,0 +1,191 @@
+"""Opt-in sampling profiler for live sessions.
+
+Set PROFILE_SESSIONS=1 to profile every session, or send SIGUSR1 to the
+process to profile the current session (or the next one if it is idle):
+
+    kill -USR1 $(pgrep -f hotword.py)
+
+While a profiled session runs, a background thread samples the Python
+stack of every thread (main loop, button polling, LED timers and the SDK's
+audio and websocket threads) PROFILE_RATE_HZ times per second using
+`sys._current_frames()`. When the session ends the samples are written as
+collapsed stacks to `PROFILE_DIR/<time>_<conversation_id>.folded`, one
+line per unique stack, rooted at the conversation ID and thread name:
+
+    conv_abc;output-thread;_output_thread (audio_interface.py:107);... 42
+
+Feed the file to flamegraph.pl or speedscope. The sampler measures its own
+CPU time and lowers its rate if it would exceed PROFILE_MAX_OVERHEAD
+(default 2% of one core).
+"""
+
+import collections
+import os
+import signal
+import sys
+import threading
+import time
+
+DEFAULT_RATE_HZ = 97  # not a multiple of common timer periods
+DEFAULT_DIRECTORY = "profiles"
+DEFAULT_MAX_OVERHEAD = 0.02
+MIN_RATE_HZ = 5
+
+
+class SamplingProfiler:
+    """Samples all threads while at least one profiled session is active."""
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, rate_hz=DEFAULT_RATE_HZ,
+                 always=False, max_overhead=DEFAULT_MAX_OVERHEAD, event_log=None):
+        self.directory = directory
+        self.rate_hz = rate_hz
+        self.always = always
+        self.max_overhead = max_overhead
+        self.event_log = event_log
+        self.armed = False
+
+        self._sessions = {}  # session key -> Counter of collapsed stacks
+        # Re-entrant: the SIGUSR1 handler runs on the main thread, which may
+        # already hold the lock in session_started()
+        self._lock = threading.RLock()
+        self._thread = None
+        self._stop = None  # stop event of the current sampler thread
+        self._labels = {}  # code object -> frame label
+        self._thread_names = {}
+        self._overhead = 0.0
+
+    @classmethod
+    def from_env(cls, event_log=None):
+        return cls(
+            directory=os.getenv("PROFILE_DIR", DEFAULT_DIRECTORY),
+            rate_hz=float(os.getenv("PROFILE_RATE_HZ", DEFAULT_RATE_HZ)),
+            always=os.getenv("PROFILE_SESSIONS", "0") == "1",
+            max_overhead=float(os.getenv("PROFILE_MAX_OVERHEAD", DEFAULT_MAX_OVERHEAD)),
+            event_log=event_log,
+        )
+
+    def install_signal_handler(self, signum=getattr(signal, "SIGUSR1", None)):
+        """Arm the profiler on `signum`. Must be called from the main thread."""
+        if signum is None:
+            return
+
+        def handler(sig, frame):
+            self.armed = True
+            # Profile sessions that are already running as well
+            with self._lock:
+                running = [key for key, counter in self._sessions.items() if counter is None]
+            for session in running:
+                self._begin(session)
+
+        signal.signal(signum, handler)
+
+    # Session hooks
+
+    def session_started(self, session: str):
+        """Begin sampling for a session if profiling is enabled or armed."""
+        with self._lock:
+            self._sessions[session] = None  # known but not profiled
+        if self.always or self.armed:
+            self.armed = False
+            self._begin(session)
+
+    def session_finished(self, session: str, conversation_id=None):
+        """Stop sampling for a session and write its collapsed stacks."""
+        with self._lock:
+            counter = self._sessions.pop(session, None)
+            idle = not any(c is not None for c in self._sessions.values())
+            # Hand the sampler off under the lock, so a session that begins
+            # while it is still shutting down starts a new one
+            thread = self._detach_sampler() if idle else None
+        if thread is not None:
+            thread.join()
+        if counter:
+            self._write(counter, conversation_id or session)
+
+    def _begin(self, session: str):
+        with self._lock:
+            if session not in self._sessions or self._sessions[session] is not None:
+                return  # unknown session, or already profiled
+            self._sessions[session] = collections.Counter()
+            if self._thread is None:
+                self._stop = threading.Event()
+                self._thread = threading.Thread(
+                    target=self._run, args=(self._stop,), name="profiler", daemon=True
+                )
+                self._thread.start()
+
+    def _detach_sampler(self):
+        """Signal the sampler thread to stop and return it. Call with the lock held."""
+        thread = self._thread
+        if thread is not None:
+            self._stop.set()
+            self._thread = None
+            self._stop = None
+        return thread
+
+    # Sampling
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+    def _refresh_thread_names(self):
+        self._thread_names = {t.ident: t.name for t in threading.enumerate()}
+
+    def _run(self, stop):
+        interval = 1.0 / self.rate_hz
+        own_ident = threading.get_ident()
+        window_started = time.monotonic()
+        window_cpu = time.thread_time()
+        self._refresh_thread_names()
+
+        while not stop.wait(interval):
+            stacks = []
+            frames = sys._current_frames()
+            for ident, frame in frames.items():
+                if ident == own_ident:
+                    continue
+                parts = []
+                while frame is not None:
+                    parts.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                # Threads started from C (PortAudio callbacks) have no Python name
+                parts.append(self._thread_names.get(ident, f"thread-{ident}"))
+                parts.reverse()
+                stacks.append(";".join(parts))
+            # Do not keep other threads' frames alive between samples
+            del frames, frame
+
+            with self._lock:
+                counters = [c for c in self._sessions.values() if c is not None]
+            for counter in counters:
+                counter.update(stacks)
+
+            now = time.monotonic()
+            if now - window_started >= 1.0:
+                cpu = time.thread_time()
+                self._overhead = (cpu - window_cpu) / (now - window_started)
+                if self._overhead > self.max_overhead and interval < 1.0 / MIN_RATE_HZ:
+                    interval = min(interval * 1.5, 1.0 / MIN_RATE_HZ)
+                window_started, window_cpu = now, cpu
+                self._refresh_thread_names()
+
+    def _write(self, counter, tag: str):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(
+            self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}_{tag}.folded"
+        )
+        root = str(tag).replace(";", "_")
+        with open(path, "w", encoding="utf-8") as folded:
+            for stack, count in counter.most_common():
+                folded.write(f"{root};{stack} {count}\n")
+        if self.event_log:
+            self.event_log.emit(
+                "profile_written",
+                path=path,
+                samples=sum(counter.values()),
+                overhead_percent=round(self._overhead * 100, 2),
+            )
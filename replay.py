@@ -0,0 +1,485 @@
+"""Replay recorded WAV files through the wake-word and session pipelines.
+
+Usage:
+    python replay.py recordings/ --threshold 0.6 0.7 0.8 --relaxation 1 2
+    python replay.py clips/ --labels labels.json --window 1.0 1.5 --slide 0.5 0.75
+    python replay.py clips/ --session --json report.json
+
+Each WAV file is fed through EfficientWord-Net's `CustomAudioStream`, the
+same sliding-window capture path `SimpleMicStream` uses on the live mic in
+raspberry-pi/hotword.py, into a `HotwordDetector`. Files are processed as
+fast as the CPU allows.
+
+Confidence scores depend only on the window and slide sizes, so each file
+is scored once per window configuration and every threshold/relaxation
+combination is evaluated from those scores afterwards. Relaxation is
+applied on the audio clock rather than the wall clock, which keeps results
+identical between runs regardless of replay speed.
+
+Labels: `--labels` points to a JSON object mapping file names to the list
+of times (seconds) where the wake word is spoken, e.g.
+`{"kitchen1.wav": [2.1, 9.8], "tv.wav": []}`. Without labels, files inside
+a directory called `positive` are expected to contain one wake word and
+all other files none.
+
+With `--session`, the audio following each detection is also played into
+a real SDK `Conversation` through `StationAudioInterface`, connected to
+the local websocket stand-in from soak_test.py. The stand-in starts
+talking right away, so the agent's audio plays (on a fake sound card that
+takes as long as real playback) while the user speaks, and it answers the
+first speech it hears with an interruption after `--server-delay`
+seconds, like the server's VAD. The barge-in detector is attached in the
+`--barge-in` mode; the recorder is not, since it writes to disk. Sessions
+run in real time, because their timing is what is being measured.
+"""
+
+import argparse
+import base64
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import wave
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+DEFAULT_REFERENCE = os.path.join("hotword_refs", "hey_eleven_ref.json")
+SESSION_CHUNK_FRAMES = 4000  # same as the live input stream
+SESSION_SECONDS = 5.0
+# The stand-in agent talks for this long at the start of every session
+AGENT_SECONDS = 4.0
+AGENT_LEVEL_DBFS = -20.0
+# Stand-in for the server's VAD: this much audio above this level is speech
+SERVER_VAD_DBFS = -40.0
+SERVER_VAD_MS = 200
+DEFAULT_SERVER_DELAY = 0.6
+
+
+def read_wav(path: str) -> np.ndarray:
+    """Read a WAV file as 16 kHz mono int16, converting if needed."""
+    with wave.open(path, "rb") as wav:
+        channels = wav.getnchannels()
+        rate = wav.getframerate()
+        width = wav.getsampwidth()
+        raw = wav.readframes(wav.getnframes())
+
+    if width != 2:
+        raise ValueError(f"{path}: only 16-bit PCM is supported")
+    samples = np.frombuffer(raw, dtype=np.int16)
+    if channels > 1:
+        # ReSpeaker firmware with several channels puts processed audio in channel 0
+        samples = samples[::channels]
+    if rate != SAMPLE_RATE:
+        positions = np.arange(0, len(samples), rate / SAMPLE_RATE)
+        samples = np.interp(positions, np.arange(len(samples)), samples).astype(np.int16)
+    return samples
+
+
+def find_wav_files(paths: list) -> list:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, n) for n in names if n.lower().endswith(".wav"))
+        else:
+            files.append(path)
+    return sorted(files)
+
+
+def load_labels(labels_path, files: list) -> dict:
+    """Map each file to its list of wake word times, or None when only
+    the count is known (directory convention)."""
+    if labels_path:
+        with open(labels_path, "r", encoding="utf-8") as labels_file:
+            by_name = json.load(labels_file)
+        labels = {}
+        for path in files:
+            times = by_name.get(path, by_name.get(os.path.basename(path)))
+            labels[path] = list(times) if times is not None else []
+        return labels
+
+    labels = {}
+    for path in files:
+        parts = os.path.normpath(path).split(os.sep)
+        labels[path] = [None] if "positive" in parts else []
+    return labels
+
+
+class WavStream:
+    """A `CustomAudioStream` whose frames come from a WAV file."""
+
+    def __init__(self, samples: np.ndarray, window_secs: float, slide_secs: float):
+        from eff_word_net.streams import CustomAudioStream
+
+        self.slide = int(slide_secs * SAMPLE_RATE)
+        # Pad the end so the last window still covers the tail of the file
+        padding = (-len(samples)) % self.slide
+        self.samples = np.concatenate([samples, np.zeros(padding, dtype=np.int16)])
+        self.position = 0
+        self.stream = CustomAudioStream(
+            open_stream=lambda: None,
+            close_stream=lambda: None,
+            get_next_frame=self._next_frame,
+            window_length_secs=window_secs,
+            sliding_window_secs=slide_secs,
+        )
+
+    def _next_frame(self):
+        frame = self.samples[self.position:self.position + self.slide]
+        self.position += self.slide
+        return frame
+
+    def frames(self):
+        """Yield (end time in seconds, window) until the file is exhausted."""
+        while self.position + self.slide <= len(self.samples):
+            frame = self.stream.getFrame()
+            yield self.position / SAMPLE_RATE, frame
+
+
+def score_file(detector, samples, window_secs, slide_secs) -> dict:
+    """Confidence for every window of one file plus per-stage timings."""
+    stream = WavStream(samples, window_secs, slide_secs)
+    scores = []
+    capture_ms = []
+    score_ms = []
+    cpu_started = time.process_time()
+
+    frames = stream.frames()
+    while True:
+        started = time.perf_counter()
+        try:
+            end_time, frame = next(frames)
+        except StopIteration:
+            break
+        captured = time.perf_counter()
+        result = detector.scoreFrame(frame)
+        scored = time.perf_counter()
+        capture_ms.append((captured - started) * 1000)
+        score_ms.append((scored - captured) * 1000)
+        # None means the detector's VAD found no voice in the window
+        scores.append((end_time, result["confidence"] if result else None))
+
+    return {
+        "scores": scores,
+        "cpu_seconds": time.process_time() - cpu_started,
+        "capture_ms": capture_ms,
+        "score_ms": score_ms,
+    }
+
+
+def detections(scores, threshold: float, relaxation: float) -> list:
+    """Apply threshold and relaxation (audio clock) to window scores."""
+    found = []
+    last = None
+    for end_time, confidence in scores:
+        if confidence is None or confidence < threshold:
+            continue
+        if last is not None and end_time - last < relaxation:
+            continue
+        found.append((end_time, confidence))
+        last = end_time
+    return found
+
+
+def evaluate(found, expected, window_secs: float) -> tuple:
+    """Count (true accepts, false accepts, false rejects) for one file.
+
+    A detection matches a labelled time if it fires within one window
+    after it (the window must have covered the utterance). Unknown times
+    (`None`) match any detection.
+    """
+    remaining = list(found)
+    true_accepts = 0
+    for wake_time in expected:
+        match = None
+        for detection in remaining:
+            if wake_time is None or wake_time <= detection[0] <= wake_time + window_secs + 0.5:
+                match = detection
+                break
+        if match:
+            remaining.remove(match)
+            true_accepts += 1
+    return true_accepts, len(remaining), len(expected) - true_accepts
+
+
+class _ReplayStream:
+    """A PyAudio stream on a sound card that is not there.
+
+    Input is pushed by `replay_session()`; writes take as long as playing
+    the audio would.
+    """
+
+    def write(self, audio, exception_on_underflow=False):
+        time.sleep(len(audio) / (2 * SAMPLE_RATE))
+
+    def stop_stream(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class _ReplayAudio:
+    """Enough of `pyaudio.PyAudio` for `StationAudioInterface`."""
+
+    def open(self, **_):
+        return _ReplayStream()
+
+    def terminate(self):
+        pass
+
+
+def agent_speech(seconds: float) -> bytes:
+    """A 220 Hz tone at AGENT_LEVEL_DBFS standing in for the agent's voice."""
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    amplitude = 32767 * 10 ** (AGENT_LEVEL_DBFS / 20) * np.sqrt(2)
+    return (amplitude * np.sin(2 * np.pi * 220 * t)).astype(np.int16).tobytes()
+
+
+def run_stand_in(server_delay: float):
+    """Websocket stand-in that talks, then interrupts on the user's speech."""
+    from barge_in import FRAME_SECONDS, FULL_SCALE_ENERGY, frame_energies
+    from soak_test import audio_message, metadata_message, serve_stand_in
+    from websockets.exceptions import ConnectionClosed
+
+    speech = agent_speech(AGENT_SECONDS)
+    chunk_bytes = SESSION_CHUNK_FRAMES * 2
+    level = FULL_SCALE_ENERGY * 10 ** (SERVER_VAD_DBFS / 10)
+    needed = max(1, round(SERVER_VAD_MS / 1000 / FRAME_SECONDS))
+    counter = iter(range(1, 1 << 62))
+
+    def interrupt(ws, event_id):
+        try:
+            ws.send(json.dumps({"type": "interruption", "interruption_event": {"event_id": event_id}}))
+        except ConnectionClosed:
+            pass
+
+    def handler(ws):
+        ws.recv()  # conversation_initiation_client_data
+        ws.send(metadata_message(f"replay-{next(counter)}"))
+        event_id = 0
+        for offset in range(0, len(speech), chunk_bytes):
+            event_id += 1
+            ws.send(audio_message(speech[offset:offset + chunk_bytes], event_id))
+        voiced = 0
+        timer = None
+        try:
+            for message in ws:
+                chunk = json.loads(message).get("user_audio_chunk")
+                if chunk is None or timer is not None:
+                    continue
+                for energy in frame_energies(base64.b64decode(chunk)):
+                    voiced = voiced + 1 if energy > level else 0
+                    if voiced >= needed:
+                        timer = threading.Timer(server_delay, interrupt, (ws, event_id))
+                        timer.start()
+                        break
+        except ConnectionClosed:
+            pass
+        if timer is not None:
+            timer.cancel()
+
+    return serve_stand_in(handler)
+
+
+def replay_session(samples, start_time: float, port: int, metrics, barge_in_mode="on") -> list:
+    """Play the audio after a detection into a conversation with the stand-in.
+
+    Returns the time each input chunk took through the session input path
+    (taps, encoding and websocket send); barge-ins go to `metrics`.
+    """
+    from audio_interface import StationAudioInterface
+    from barge_in import BargeInDetector
+    from elevenlabs.client import ElevenLabs
+    from elevenlabs.conversational_ai.conversation import Conversation
+
+    interface = StationAudioInterface(audio=_ReplayAudio())
+    BargeInDetector(mode=barge_in_mode, metrics=metrics, station="replay").attach(interface)
+    conversation = Conversation(
+        ElevenLabs(api_key="replay", base_url=f"http://127.0.0.1:{port}"),
+        "replay-agent",
+        requires_auth=False,
+        audio_interface=interface,
+    )
+    conversation.start_session()
+    deadline = time.monotonic() + 5
+    while interface.out_stream is None:
+        if time.monotonic() > deadline:
+            conversation.end_session()
+            raise RuntimeError("The session stand-in did not start the audio interface")
+        time.sleep(0.01)
+
+    start = int(start_time * SAMPLE_RATE)
+    end = min(len(samples), start + int(SESSION_SECONDS * SAMPLE_RATE))
+    chunk_ms = []
+    due = time.monotonic()
+    for offset in range(start, end - SESSION_CHUNK_FRAMES + 1, SESSION_CHUNK_FRAMES):
+        # Chunks arrive when a microphone would deliver them
+        due += SESSION_CHUNK_FRAMES / SAMPLE_RATE
+        delay = due - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        chunk = samples[offset:offset + SESSION_CHUNK_FRAMES].tobytes()
+        started = time.perf_counter()
+        interface._in_callback(chunk, SESSION_CHUNK_FRAMES, None, 0)
+        chunk_ms.append((time.perf_counter() - started) * 1000)
+    conversation.end_session()
+    conversation.wait_for_session_end()
+    return chunk_ms
+
+
+def _stats(values: list) -> dict:
+    if not values:
+        return {"p50": None, "p95": None, "max": None}
+    ordered = sorted(values)
+    return {
+        "p50": round(statistics.median(ordered), 3),
+        "p95": round(ordered[int(0.95 * (len(ordered) - 1))], 3),
+        "max": round(ordered[-1], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay WAV files through the wake-word pipeline.")
+    parser.add_argument("paths", nargs="+", help="WAV files or directories")
+    parser.add_argument("--labels", help="JSON file with wake word times per file")
+    parser.add_argument("--reference", default=DEFAULT_REFERENCE, help="hotword reference JSON")
+    parser.add_argument("--hotword", default="hey_eleven")
+    parser.add_argument("--threshold", type=float, nargs="+", default=[0.7])
+    parser.add_argument("--relaxation", type=float, nargs="+", default=[2.0])
+    parser.add_argument("--window", type=float, nargs="+", default=[1.5])
+    parser.add_argument("--slide", type=float, nargs="+", default=[0.75])
+    parser.add_argument("--session", action="store_true",
+                        help="also replay the audio after each detection into a conversation")
+    parser.add_argument("--barge-in", choices=("observe", "on"), default="on",
+                        help="barge-in detector mode for --session")
+    parser.add_argument("--server-delay", type=float, default=DEFAULT_SERVER_DELAY,
+                        help="seconds from the user's speech to the stand-in server's interruption")
+    parser.add_argument("--json", help="write the full report to this file")
+    args = parser.parse_args()
+
+    files = find_wav_files(args.paths)
+    if not files:
+        print("No WAV files found.")
+        sys.exit(1)
+    labels = load_labels(args.labels, files)
+
+    try:
+        from eff_word_net.audio_processing import Resnet50_Arc_loss
+        from eff_word_net.engine import HotwordDetector
+    except ImportError as e:
+        print(f"EfficientWord-Net is required for replay: {e}")
+        print("Install it with: pip install EfficientWord-Net")
+        sys.exit(1)
+
+    audio = {path: read_wav(path) for path in files}
+    audio_seconds = sum(len(samples) for samples in audio.values()) / SAMPLE_RATE
+    negative_seconds = sum(
+        len(audio[path]) for path in files if not labels[path]
+    ) / SAMPLE_RATE
+    print(f"Replaying {len(files)} files, {audio_seconds:.0f} s of audio.")
+
+    base_model = Resnet50_Arc_loss()
+    # Threshold 0 and no relaxation: every voiced window reports its confidence
+    # and the sweep below applies the real settings on the audio clock.
+    detector = HotwordDetector(
+        hotword=args.hotword,
+        model=base_model,
+        reference_file=args.reference,
+        threshold=0.0,
+        relaxation_time=0,
+    )
+
+    if args.session:
+        from metrics import SessionMetrics
+
+        server, port = run_stand_in(args.server_delay)
+
+    report = {"files": len(files), "audio_seconds": round(audio_seconds, 1), "results": []}
+    for window_secs in args.window:
+        for slide_secs in args.slide:
+            scored = {
+                path: score_file(detector, samples, window_secs, slide_secs)
+                for path, samples in audio.items()
+            }
+            cpu = sum(s["cpu_seconds"] for s in scored.values())
+            capture_ms = [v for s in scored.values() for v in s["capture_ms"]]
+            score_ms = [v for s in scored.values() for v in s["score_ms"]]
+
+            for threshold in args.threshold:
+                for relaxation in args.relaxation:
+                    totals = [0, 0, 0]
+                    per_file = {}
+                    session_ms = []
+                    session_metrics = SessionMetrics() if args.session else None
+                    for path in files:
+                        found = detections(scored[path]["scores"], threshold, relaxation)
+                        counts = evaluate(found, labels[path], window_secs)
+                        totals = [a + b for a, b in zip(totals, counts)]
+                        per_file[path] = {
+                            "detections": [[round(t, 2), round(c, 3)] for t, c in found],
+                            "true_accepts": counts[0],
+                            "false_accepts": counts[1],
+                            "false_rejects": counts[2],
+                        }
+                        if args.session:
+                            for detection_time, _ in found:
+                                session_ms.extend(replay_session(
+                                    audio[path], detection_time, port, session_metrics, args.barge_in
+                                ))
+
+                    expected = sum(len(labels[p]) for p in files)
+                    result = {
+                        "window": window_secs,
+                        "slide": slide_secs,
+                        "threshold": threshold,
+                        "relaxation": relaxation,
+                        "true_accepts": totals[0],
+                        "false_accepts": totals[1],
+                        "false_rejects": totals[2],
+                        "false_reject_rate": round(totals[2] / expected, 3) if expected else None,
+                        "false_accepts_per_hour": (
+                            round(totals[1] * 3600 / negative_seconds, 2) if negative_seconds else None
+                        ),
+                        "cpu_per_audio_second": round(cpu / audio_seconds, 4),
+                        "realtime_factor": round(audio_seconds / cpu, 1) if cpu else None,
+                        "stage_ms": {"capture": _stats(capture_ms), "score": _stats(score_ms)},
+                        "files": per_file,
+                    }
+                    if args.session:
+                        result["stage_ms"]["session_input"] = _stats(session_ms)
+                        result["barge_in"] = session_metrics.summary()["stations"].get("replay", {})
+                    report["results"].append(result)
+
+                    print(
+                        f"window {window_secs}s slide {slide_secs}s threshold {threshold} "
+                        f"relaxation {relaxation}s: TA {totals[0]}, FA {totals[1]}, FR {totals[2]}, "
+                        f"CPU {result['cpu_per_audio_second'] * 1000:.1f} ms per audio-second, "
+                        f"score p95 {result['stage_ms']['score']['p95']} ms"
+                    )
+                    if args.session:
+                        barge_in = result["barge_in"]
+                        local = barge_in.get("barge_in_local_ms", {}).get("p50")
+                        server_ms = barge_in.get("barge_in_server_ms", {}).get("p50")
+                        print(
+                            f"  session: input p95 {result['stage_ms']['session_input']['p95']} ms, "
+                            f"barge-ins {barge_in.get('barge_ins', 0)}, "
+                            f"false {barge_in.get('barge_in_false', 0)}, "
+                            f"missed {barge_in.get('barge_in_missed', 0)}, "
+                            f"local p50 {local} ms, server p50 {server_ms} ms"
+                        )
+
+    if args.session:
+        server.shutdown()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, indent=2)
+        print(f"Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
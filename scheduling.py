@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""CPU affinity and scheduling priority for the assistant's threads.
+
+Threads are grouped into roles:
+
+- `audio`: the PortAudio input callback thread and the output writer thread,
+- `button`: the gpiod polling thread and RPi.GPIO's edge callback thread,
+- `led`: the LED meter and software PWM threads,
+- `inference`: processes started with `python scheduling.py run inference
+  -- ...`, such as the wake-word detector in raspberry-pi/,
+- `default`: the main thread at startup. Threads created later (event log,
+  transcript store, the SDK's websocket thread, ...) inherit its CPU
+  affinity and nice value unless their role overrides it, but not a
+  real-time policy: see SCHED_RESET_ON_FORK below.
+
+Each role is configured by SCHED_<ROLE>_CPUS (e.g. "3" or "0-2"), _POLICY
+(`fifo`, `rr` or `other`), _PRIORITY (1-99 for fifo/rr) and _NICE. Roles
+without any of these are left alone. A thread applies its role to itself
+when it starts (threads created by PortAudio and RPi.GPIO on their first
+callback), so the settings affect that one thread only.
+
+Real-time policies need CAP_SYS_NICE or an rtprio limit, e.g.
+`@audio - rtprio 95` in /etc/security/limits.d/. Without it the role falls
+back to its nice value; a negative nice value that is not permitted either
+leaves the thread as it was. What was applied is printed once per role and
+written as a `scheduling` event. Real-time threads use
+SCHED_RESET_ON_FORK, so threads they start get normal scheduling at
+nice 0. Values that cannot be parsed are reported and ignored.
+
+Usage:
+    python scheduling.py jitter --role audio --load 0.9
+    python scheduling.py run inference -- python raspberry-pi/hotword.py
+
+`jitter` measures how late a periodic thread wakes up, first with the
+inherited scheduling and then with the role applied, under optional
+synthetic CPU load.
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+ROLES = ("default", "audio", "button", "led", "inference")
+POLICIES = ("fifo", "rr", "other")
+DEFAULT_PRIORITIES = {"default": 1, "audio": 70, "button": 60, "led": 20, "inference": 10}
+
+
+def parse_cpus(spec: str) -> set:
+    """CPU list like "0-2,5" as a set of CPU numbers."""
+    cpus = set()
+    for part in spec.replace(" ", "").split(","):
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-", 1)
+            cpus.update(range(int(first), int(last) + 1))
+        else:
+            cpus.add(int(part))
+    return cpus
+
+
+def _env_setting(name: str, parse, default=None):
+    """Parsed value of environment variable `name`, or `default` with a
+    warning if it is set but invalid."""
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        return parse(value)
+    except ValueError:
+        print(f"Ignoring {name}={value!r}: not a valid value")
+        return default
+
+
+def _policy(value: str) -> str:
+    value = value.lower()
+    if value not in POLICIES:
+        raise ValueError(value)
+    return value
+
+
+def format_cpus(cpus) -> str:
+    return ",".join(str(cpu) for cpu in sorted(cpus))
+
+
+class RolePolicy:
+    """Scheduling settings for one role."""
+
+    def __init__(self, role, cpus=None, policy="other", priority=None, nice=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown scheduling policy '{policy}' for {role}; use one of {POLICIES}")
+        self.role = role
+        self.cpus = cpus
+        self.policy = policy
+        self.priority = priority if priority is not None else DEFAULT_PRIORITIES[role]
+        self.nice = nice
+
+    def describe(self) -> str:
+        parts = []
+        if self.policy != "other":
+            parts.append(f"{self.policy} {self.priority}")
+        if self.nice is not None:
+            parts.append(f"nice {self.nice}")
+        if self.cpus:
+            parts.append(f"cpus {format_cpus(self.cpus)}")
+        return ", ".join(parts) or "unchanged"
+
+
+class Scheduler:
+    """Applies per-role affinity and priority to the calling thread."""
+
+    def __init__(self, roles: dict, event_log=None):
+        self.roles = roles
+        self.event_log = event_log
+        self.outcomes = {}  # role -> what was applied, reported once per role
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, event_log=None):
+        """Scheduler for the roles configured by SCHED_* variables, or None
+        if no role is configured."""
+        roles = {}
+        for role in ROLES:
+            prefix = f"SCHED_{role.upper()}_"
+            cpus = _env_setting(prefix + "CPUS", parse_cpus)
+            policy = _env_setting(prefix + "POLICY", _policy)
+            priority = _env_setting(prefix + "PRIORITY", int)
+            nice = _env_setting(prefix + "NICE", int)
+            if not (cpus or policy or priority is not None or nice is not None):
+                continue
+            roles[role] = RolePolicy(
+                role, cpus=cpus, policy=policy or "other", priority=priority, nice=nice,
+            )
+        return cls(roles, event_log) if roles else None
+
+    def apply(self, role: str, reset_on_fork=True) -> str:
+        """Apply `role` to the calling thread; returns what was applied."""
+        policy = self.roles.get(role)
+        if policy is None:
+            return ""
+        outcome = apply_policy(policy, threading.get_native_id(), reset_on_fork)
+        with self._lock:
+            if role in self.outcomes:
+                return outcome
+            self.outcomes[role] = outcome
+        print(f"Scheduling {role}: {outcome}")
+        if self.event_log:
+            self.event_log.emit("scheduling", role=role, outcome=outcome)
+        return outcome
+
+
+def apply_policy(policy: RolePolicy, tid: int, reset_on_fork=True) -> str:
+    """Set affinity, policy and nice value of thread `tid` as far as permitted."""
+    done = []
+    if policy.cpus:
+        try:
+            os.sched_setaffinity(tid, policy.cpus)
+            done.append(f"cpus {format_cpus(policy.cpus)}")
+        except AttributeError:
+            done.append("no CPU affinity on this platform")
+        except OSError as e:
+            done.append(f"cpus {format_cpus(policy.cpus)} failed ({e.strerror})")
+
+    realtime = False
+    if policy.policy != "other":
+        if not hasattr(os, "sched_setscheduler"):
+            done.append("no real-time scheduling on this platform")
+        else:
+            kind = os.SCHED_FIFO if policy.policy == "fifo" else os.SCHED_RR
+            low, high = os.sched_get_priority_min(kind), os.sched_get_priority_max(kind)
+            priority = min(max(policy.priority, low), high)
+            if reset_on_fork:
+                kind |= os.SCHED_RESET_ON_FORK
+            try:
+                os.sched_setscheduler(tid, kind, os.sched_param(priority))
+                done.append(f"{policy.policy} {priority}")
+                realtime = True
+            except PermissionError:
+                done.append(f"{policy.policy} {priority} not permitted")
+            except OSError as e:
+                done.append(f"{policy.policy} {priority} failed ({e.strerror})")
+
+    if policy.nice is not None and not realtime:
+        try:
+            # On Linux the nice value is per thread, so a thread ID only affects that thread
+            os.setpriority(os.PRIO_PROCESS, tid, policy.nice)
+            done.append(f"nice {policy.nice}")
+        except PermissionError:
+            done.append(f"nice {policy.nice} not permitted")
+        except (AttributeError, OSError) as e:
+            done.append(f"nice {policy.nice} failed ({e})")
+    return ", ".join(done) or "unchanged"
+
+
+# The scheduler used by apply(); set by install() at startup
+_installed = None
+
+
+def install(scheduler):
+    """Use `scheduler` for `apply()` and apply the default role to the
+    calling thread, so threads started after this inherit it."""
+    global _installed
+    _installed = scheduler
+    if scheduler:
+        scheduler.apply("default")
+
+
+def apply(role: str):
+    """Apply `role` to the calling thread if a scheduler is installed."""
+    if _installed is not None:
+        _installed.apply(role)
+
+
+# Jitter measurement
+
+def probe(period: float, seconds: float, setup=None) -> list:
+    """Wake-up lateness in seconds of a thread sleeping until each period."""
+    lateness = []
+
+    def run():
+        if setup:
+            setup()
+        deadline = time.monotonic() + period
+        end = deadline + seconds
+        while deadline < end:
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            lateness.append(time.monotonic() - deadline)
+            deadline += period
+
+    thread = threading.Thread(target=run, name="jitter-probe")
+    thread.start()
+    thread.join()
+    return lateness
+
+
+def summarize(lateness: list, period: float) -> dict:
+    ordered = sorted(lateness)
+
+    def percentile(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1e6
+
+    return {
+        "p50_us": round(percentile(0.5)),
+        "p99_us": round(percentile(0.99)),
+        "p999_us": round(percentile(0.999)),
+        "max_us": round(ordered[-1] * 1e6),
+        "late": sum(1 for value in ordered if value > period),
+    }
+
+
+def print_summary(label: str, summary: dict):
+    print(
+        f"  {label:<6} p50 {summary['p50_us']:>6} µs  p99 {summary['p99_us']:>6} µs  "
+        f"p99.9 {summary['p999_us']:>6} µs  max {summary['max_us']:>7} µs  "
+        f"{summary['late']} wake-ups later than a period"
+    )
+
+
+def jitter(args):
+    from audio_autotune import SyntheticLoad
+
+    scheduler = Scheduler.from_env()
+    policy = scheduler.roles.get(args.role) if scheduler else None
+    if policy is None:
+        print(f"No SCHED_{args.role.upper()}_* settings; measuring without them anyway.")
+    period = args.period_ms / 1000
+    print(
+        f"Role {args.role} ({policy.describe() if policy else 'unchanged'}), "
+        f"{args.period_ms:g} ms period, {args.seconds:g} s per run, "
+        f"load {args.load_workers} processes at {args.load:.0%}, GIL {args.gil_load:.0%}"
+    )
+    with SyntheticLoad(args.load, args.load_workers, args.gil_load):
+        before = summarize(probe(period, args.seconds), period)
+        print_summary("before", before)
+        outcomes = []
+        after = summarize(probe(
+            period, args.seconds,
+            setup=(lambda: outcomes.append(apply_policy(policy, threading.get_native_id())))
+            if policy else None,
+        ), period)
+        print_summary("after", after)
+    print(f"Applied: {outcomes[0] if outcomes else 'nothing'}")
+
+
+def run(args):
+    scheduler = Scheduler.from_env()
+    if scheduler and args.role in scheduler.roles:
+        # Without reset-on-fork, so the command's own threads inherit the role
+        scheduler.apply(args.role, reset_on_fork=False)
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+    if not command:
+        print("Usage: python scheduling.py run ROLE -- COMMAND [ARGS...]")
+        return 2
+    os.execvp(command[0], command)
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Thread scheduling tools.")
+    commands = parser.add_subparsers(dest="action", required=True)
+
+    measure = commands.add_parser("jitter", help="measure wake-up jitter before and after a role")
+    measure.add_argument("--role", choices=ROLES, default="audio")
+    measure.add_argument("--period-ms", type=float, default=10.0)
+    measure.add_argument("--seconds", type=float, default=10.0, help="duration of each run")
+    measure.add_argument("--load", type=float, default=0.9, help="busy fraction of each load process")
+    measure.add_argument("--load-workers", type=int, default=os.cpu_count() or 4)
+    measure.add_argument("--gil-load", type=float, default=0.0,
+                         help="fraction of time a Python thread holds the GIL")
+
+    launch = commands.add_parser("run", help="run a command with a role applied")
+    launch.add_argument("role", choices=ROLES)
+    launch.add_argument("command", nargs=argparse.REMAINDER)
+
+    args = parser.parse_args()
+    if args.action == "jitter":
+        return jitter(args)
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
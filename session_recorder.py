@@ -0,0 +1,327 @@
+"""Optional recording of session audio for debugging complaints.
+
+When RECORDING_DIR is set, every session's microphone input and agent
+output are streamed to `<dir>/<time>_<conversation_id>_in.wav` and
+`..._out.wav` (or `.flac` with RECORDING_FORMAT=flac and the `soundfile`
+package installed).
+
+The audio taps copy each chunk into a fixed set of preallocated blocks
+(a single-producer/single-consumer ring per direction), so recording never
+allocates on the audio path and memory use stays constant. One writer
+thread drains every active recording. If the disk cannot keep up and a
+ring fills, new audio is dropped (and replaced by silence where it was
+dropped) instead of stalling the audio threads. Partial files of a
+recording that fails are deleted.
+
+After each recording the oldest files are deleted until the directory is
+within RECORDING_MAX_MB and no file is older than RECORDING_MAX_AGE_DAYS.
+"""
+
+import importlib.util
+import os
+import threading
+import time
+import wave
+
+from audio_interface import SAMPLE_RATE
+
+SAMPLE_WIDTH = 2  # 16-bit PCM
+BYTES_PER_SECOND = SAMPLE_RATE * SAMPLE_WIDTH
+BLOCK_SIZE = 4096
+DEFAULT_BUFFER_SECONDS = 10.0
+DEFAULT_MAX_MB = 500
+DEFAULT_MAX_AGE_DAYS = 7
+WRITER_INTERVAL_SECONDS = 0.2
+# Output gaps shorter than this are not padded with silence
+MIN_GAP_SECONDS = 0.05
+
+SOUNDFILE_AVAILABLE = importlib.util.find_spec("soundfile") is not None
+
+
+class _BlockRing:
+    """Single-producer/single-consumer ring of preallocated byte blocks.
+
+    The producer only advances `head` and the consumer only advances
+    `tail`, so neither side needs a lock.
+    """
+
+    def __init__(self, buffer_seconds: float):
+        count = max(4, int(buffer_seconds * BYTES_PER_SECOND) // BLOCK_SIZE)
+        self.blocks = [bytearray(BLOCK_SIZE) for _ in range(count)]
+        self.lengths = [0] * count
+        self.times = [0.0] * count
+        # Bytes dropped before each block, so the gap is filled where it was
+        self.dropped_before = [0] * count
+        self.head = 0
+        self.tail = 0
+        self.dropped_bytes = 0
+
+    def put(self, data):
+        """Copy `data` into free blocks; drop whatever does not fit."""
+        view = memoryview(data)
+        count = len(self.blocks)
+        now = time.monotonic()
+        while view:
+            if self.head - self.tail >= count:
+                self.dropped_bytes += len(view)
+                return
+            slot = self.head % count
+            size = min(len(view), BLOCK_SIZE)
+            self.blocks[slot][:size] = view[:size]
+            self.lengths[slot] = size
+            self.times[slot] = now
+            self.dropped_before[slot] = self.dropped_bytes
+            self.head += 1  # publish the block only after it is filled
+            view = view[size:]
+            now += size / BYTES_PER_SECOND
+
+    def take(self):
+        """Yield (timestamp, bytes dropped before it, memoryview) for every filled block."""
+        count = len(self.blocks)
+        while self.tail < self.head:
+            slot = self.tail % count
+            yield (self.times[slot], self.dropped_before[slot],
+                   memoryview(self.blocks[slot])[:self.lengths[slot]])
+            self.tail += 1
+
+
+class _AudioFile:
+    """One direction of a recording: a ring plus the file it drains into."""
+
+    def __init__(self, path: str, buffer_seconds: float, pad_gaps: bool):
+        self.path = path
+        self.ring = _BlockRing(buffer_seconds)
+        self.pad_gaps = pad_gaps
+        self.started = time.monotonic()
+        self.written_bytes = 0
+        self.seen_dropped = 0
+        if path.endswith(".flac"):
+            import soundfile
+            self._sound_file = soundfile.SoundFile(
+                path, mode="w", samplerate=SAMPLE_RATE, channels=1,
+                format="FLAC", subtype="PCM_16",
+            )
+            self._wave = None
+        else:
+            self._sound_file = None
+            self._wave = wave.open(path, "wb")
+            self._wave.setnchannels(1)
+            self._wave.setsampwidth(SAMPLE_WIDTH)
+            self._wave.setframerate(SAMPLE_RATE)
+
+    def _write(self, data):
+        if self._wave:
+            self._wave.writeframesraw(data)
+        else:
+            self._sound_file.buffer_write(data, dtype="int16")
+        self.written_bytes += len(data)
+
+    def _silence(self, byte_count: int):
+        byte_count -= byte_count % SAMPLE_WIDTH
+        while byte_count > 0:
+            size = min(byte_count, BYTES_PER_SECOND)
+            self._write(bytes(size))
+            byte_count -= size
+
+    def drain(self):
+        for timestamp, dropped, data in self.ring.take():
+            if dropped != self.seen_dropped:
+                self._silence(dropped - self.seen_dropped)
+                self.seen_dropped = dropped
+            if self.pad_gaps:
+                # Agent audio only arrives while it speaks; keep it aligned with
+                # the input file by filling the pauses with silence.
+                expected = (timestamp - self.started) * BYTES_PER_SECOND
+                gap = int(expected - self.written_bytes)
+                if gap > MIN_GAP_SECONDS * BYTES_PER_SECOND:
+                    self._silence(gap)
+            self._write(data)
+
+    def close(self):
+        self.drain()
+        # Audio dropped after the last block; the taps are detached by now
+        dropped = self.ring.dropped_bytes
+        if dropped != self.seen_dropped:
+            self._silence(dropped - self.seen_dropped)
+            self.seen_dropped = dropped
+        if self._wave:
+            self._wave.close()
+        else:
+            self._sound_file.close()
+
+
+class Recording:
+    """Input and output audio of one session."""
+
+    def __init__(self, manager, session: str):
+        self.manager = manager
+        self.session = session
+        self.finished = False
+        self.conversation_id = None
+        prefix = os.path.join(manager.directory, f".{session}")
+        extension = manager.extension
+        self.input = _AudioFile(f"{prefix}_in{extension}", manager.buffer_seconds, pad_gaps=False)
+        self.output = _AudioFile(f"{prefix}_out{extension}", manager.buffer_seconds, pad_gaps=True)
+        self.started_wall = time.localtime()
+
+    def attach(self, audio_interface):
+        """Tap the interface's input and output chunks."""
+        audio_interface.input_taps.append(self.input.ring.put)
+        audio_interface.output_taps.append(self.output.ring.put)
+
+    @property
+    def dropped_bytes(self) -> int:
+        return self.input.ring.dropped_bytes + self.output.ring.dropped_bytes
+
+    def finish(self, conversation_id=None):
+        """Mark the session as ended; the writer closes and renames the files."""
+        self.conversation_id = conversation_id
+        self.finished = True
+
+    def _final_path(self, audio_file: _AudioFile, suffix: str) -> str:
+        name = "{}_{}_{}{}".format(
+            time.strftime("%Y%m%d-%H%M%S", self.started_wall),
+            self.conversation_id or self.session,
+            suffix,
+            self.manager.extension,
+        )
+        return os.path.join(self.manager.directory, name)
+
+    def _discard(self):
+        """Close and delete the partial files of a failed recording."""
+        for audio_file in (self.input, self.output):
+            try:
+                if audio_file._wave:
+                    audio_file._wave.close()
+                else:
+                    audio_file._sound_file.close()
+            except (OSError, RuntimeError):
+                pass
+            try:
+                os.remove(audio_file.path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Could not remove partial recording {audio_file.path}: {e}")
+
+    def _close(self):
+        for audio_file, suffix in ((self.input, "in"), (self.output, "out")):
+            audio_file.close()
+            os.replace(audio_file.path, self._final_path(audio_file, suffix))
+        if self.dropped_bytes:
+            print(
+                f"Recording of {self.conversation_id or self.session} dropped "
+                f"{self.dropped_bytes / BYTES_PER_SECOND:.1f} s of audio (disk too slow)."
+            )
+
+
+class RecordingManager:
+    """Owns the writer thread and enforces retention for all recordings."""
+
+    def __init__(self, directory: str, audio_format="wav", buffer_seconds=DEFAULT_BUFFER_SECONDS,
+                 max_bytes=DEFAULT_MAX_MB * 1024 * 1024, max_age_seconds=DEFAULT_MAX_AGE_DAYS * 86400):
+        if audio_format == "flac" and not SOUNDFILE_AVAILABLE:
+            print("RECORDING_FORMAT=flac requires the soundfile package; recording WAV instead.")
+            audio_format = "wav"
+        self.directory = directory
+        self.extension = f".{audio_format}"
+        self.buffer_seconds = buffer_seconds
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self._recordings = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_env(cls):
+        """Manager for RECORDING_DIR, or None when recording is disabled."""
+        directory = os.getenv("RECORDING_DIR")
+        if not directory:
+            return None
+        return cls(
+            directory,
+            audio_format=os.getenv("RECORDING_FORMAT", "wav").lower(),
+            buffer_seconds=float(os.getenv("RECORDING_BUFFER_SECONDS", DEFAULT_BUFFER_SECONDS)),
+            max_bytes=int(float(os.getenv("RECORDING_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024),
+            max_age_seconds=float(os.getenv("RECORDING_MAX_AGE_DAYS", DEFAULT_MAX_AGE_DAYS)) * 86400,
+        )
+
+    def start(self):
+        if self._thread is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self.enforce_retention()
+        self._thread = threading.Thread(target=self._run, name="recorder", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Finish every open recording and stop the writer thread."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def start_recording(self, session: str):
+        """Begin recording a session, or return None if the writer is not running."""
+        if self._thread is None:
+            return None
+        try:
+            recording = Recording(self, session)
+        except (OSError, RuntimeError) as e:
+            print(f"Could not start recording: {e}")
+            return None
+        with self._lock:
+            self._recordings.append(recording)
+        return recording
+
+    def _run(self):
+        while True:
+            stopping = self._stop.wait(WRITER_INTERVAL_SECONDS)
+            with self._lock:
+                recordings = list(self._recordings)
+            for recording in recordings:
+                try:
+                    if recording.finished or stopping:
+                        recording._close()
+                        with self._lock:
+                            self._recordings.remove(recording)
+                        self.enforce_retention()
+                    else:
+                        recording.input.drain()
+                        recording.output.drain()
+                except (OSError, RuntimeError) as e:
+                    print(f"Recording of {recording.session} failed: {e}")
+                    recording._discard()
+                    with self._lock:
+                        if recording in self._recordings:
+                            self._recordings.remove(recording)
+            if stopping:
+                return
+
+    def enforce_retention(self):
+        """Delete recordings that are too old or exceed the size budget."""
+        now = time.time()
+        with self._lock:
+            in_progress = {audio_file.path for recording in self._recordings
+                           for audio_file in (recording.input, recording.output)}
+        files = []
+        for entry in os.scandir(self.directory):
+            # Files of recordings in progress start with a dot; dot files of
+            # no current recording were left by a crash and are swept too
+            if entry.is_file() and entry.path not in in_progress \
+                    and entry.name.endswith((".wav", ".flac")):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()
+
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in files:
+            if now - mtime <= self.max_age_seconds and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError as e:
+                print(f"Could not remove old recording {path}: {e}")
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""Soak test: thousands of back-to-back sessions with leak detection.
+
+Usage:
+    python soak_test.py --sessions 5000 --snapshot-every 250
+
+Runs the real `hotword.start_conversation_flow()` over and over, with
+everything except the network and hardware left in place: the SDK's
+`Conversation` talks to a local websocket stand-in for the ElevenLabs
+server, `StationAudioInterface` runs on a fake PortAudio that produces
+silence, and the status LED is driven through a fake GPIO module. The
+event log, transcript store and health monitor run as usual, writing into
+a temporary directory.
+
+After a warm-up, every `--snapshot-every` sessions the test takes a
+tracemalloc snapshot and counts RSS, open file descriptors, threads and
+`threading.Timer` objects. It exits with status 1 if the growth per
+session since the warm-up exceeds the budget, and prints the allocation
+sites that grew the most. The heap growth per session is the slope fitted
+through all snapshots; the final counts are taken before the stand-in
+server and the background threads are stopped.
+"""
+
+import argparse
+import base64
+import gc
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+CHUNK_FRAMES = 4000
+AUDIO_CHUNK = bytes(CHUNK_FRAMES * 2)  # 250ms of 16 kHz silence
+
+
+class FakeStream:
+    """Stands in for a PyAudio stream; input streams call back with silence."""
+
+    def __init__(self, stream_callback=None, frames_per_buffer=CHUNK_FRAMES, chunk_interval=0.005, **_):
+        self.callback = stream_callback
+        self.frames = frames_per_buffer
+        self.chunk_interval = chunk_interval
+        self.stopped = threading.Event()
+        self.thread = None
+        if stream_callback:
+            self.thread = threading.Thread(target=self._run, name="fake-input", daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        chunk = bytes(self.frames * 2)
+        while not self.stopped.wait(self.chunk_interval):
+            self.callback(chunk, self.frames, None, 0)
+
+    def write(self, audio, exception_on_underflow=False):
+        pass
+
+    def stop_stream(self):
+        self.stopped.set()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def close(self):
+        self.stop_stream()
+
+
+class FakePyAudio:
+    """Enough of `pyaudio.PyAudio` for `StationAudioInterface`."""
+
+    def open(self, **kwargs):
+        return FakeStream(**kwargs)
+
+    def terminate(self):
+        pass
+
+
+class FakeGPIO:
+    """Enough of `RPi.GPIO` for the status LED helpers."""
+
+    HIGH = 1
+    LOW = 0
+    writes = 0
+
+    def output(self, pin, level):
+        FakeGPIO.writes += 1
+
+
+def metadata_message(conversation_id: str) -> str:
+    """The server's first message of a conversation."""
+    return json.dumps({
+        "type": "conversation_initiation_metadata",
+        "conversation_initiation_metadata_event": {
+            "conversation_id": conversation_id,
+            "agent_output_audio_format": "pcm_16000",
+            "user_input_audio_format": "pcm_16000",
+        },
+    })
+
+
+def audio_message(audio: bytes, event_id: int) -> str:
+    """One chunk of agent audio."""
+    return json.dumps({
+        "type": "audio",
+        "audio_event": {"audio_base_64": base64.b64encode(audio).decode(), "event_id": event_id},
+    })
+
+
+def serve_stand_in(handler):
+    """Serve `handler(ws)` for every conversation on a local port; return (server, port).
+
+    The SDK connects to it when the ElevenLabs client's base URL is
+    `http://127.0.0.1:<port>` and the conversation does not require auth.
+    """
+    from websockets.sync.server import serve
+
+    server = serve(handler, "127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, name="stand-in-server", daemon=True).start()
+    return server, server.socket.getsockname()[1]
+
+
+def run_server(turns: int, audio_chunks: int):
+    """Start the websocket stand-in; return (server, port)."""
+    counter = iter(range(1, 1 << 62))
+
+    def handler(ws):
+        number = next(counter)
+        ws.recv()  # conversation_initiation_client_data
+        ws.send(metadata_message(f"soak-{number}"))
+        event_id = 0
+        for turn in range(turns):
+            ws.recv()  # one user audio chunk per turn
+            ws.send(json.dumps({
+                "type": "user_transcript",
+                "user_transcription_event": {"user_transcript": f"fråga {turn} i session {number}"},
+            }))
+            ws.send(json.dumps({"type": "ping", "ping_event": {"event_id": turn, "ping_ms": 5}}))
+            ws.send(json.dumps({
+                "type": "agent_response",
+                "agent_response_event": {"agent_response": f"svar {turn} i session {number}"},
+            }))
+            for _ in range(audio_chunks):
+                event_id += 1
+                ws.send(audio_message(AUDIO_CHUNK, event_id))
+        ws.close()
+
+    return serve_stand_in(handler)
+
+
+def take_snapshot():
+    """tracemalloc snapshot without tracemalloc's own bookkeeping."""
+    return tracemalloc.take_snapshot().filter_traces(
+        [tracemalloc.Filter(False, tracemalloc.__file__)]
+    )
+
+
+def measure(health) -> dict:
+    # Websocket compressors and SDK handler objects sit in reference cycles;
+    # collect them so only memory that is really kept alive counts
+    gc.collect()
+    sample = health.sample()
+    return {
+        "rss_mb": sample["rss_mb"],
+        "fds": sample["open_fds"],
+        "threads": sample["threads"],
+        "timers": sample["timers"],
+    }
+
+
+def growth_slope(points) -> float:
+    """Heap growth in bytes per session, fitted through all snapshots."""
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    spread = sum((x - mean_x) ** 2 for x, _ in points)
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Back-to-back session soak test.")
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=50, help="sessions before the baseline")
+    parser.add_argument("--snapshot-every", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=2, help="turns per session")
+    parser.add_argument("--audio-chunks", type=int, default=4, help="agent audio chunks per turn")
+    parser.add_argument("--trace-frames", type=int, default=1, help="tracemalloc stack depth")
+    parser.add_argument("--max-bytes-per-session", type=float, default=1024,
+                        help="traced heap growth budget per session")
+    parser.add_argument("--max-fd-growth", type=int, default=2)
+    parser.add_argument("--max-thread-growth", type=int, default=2)
+    parser.add_argument("--top", type=int, default=10, help="allocation sites to report")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="hanson-soak-")
+    os.environ.setdefault("ELEVENLABS_AGENT_ID", "soak-agent")
+    os.environ.setdefault("ELEVENLABS_API_KEY", "soak-key")
+    os.environ["EVENT_LOG_PATH"] = os.path.join(workdir, "events.jsonl")
+    os.environ["EVENT_LOG_ECHO"] = "0"
+    # Small enough that the ring is full before the baseline, so its slots
+    # filling up is not mistaken for growth
+    os.environ["EVENT_LOG_CAPACITY"] = "256"
+    os.environ["TRANSCRIPT_DB"] = os.path.join(workdir, "transcripts.db")
+    os.environ["HEALTH_INTERVAL_SECONDS"] = "0"  # sampled explicitly below
+    os.environ.pop("RECORDING_DIR", None)
+
+    import hotword
+    from elevenlabs.client import ElevenLabs
+    from health_monitor import HealthMonitor
+
+    server, port = run_server(args.turns, args.audio_chunks)
+    # The SDK derives the conversation websocket URL from the base URL
+    hotword.elevenlabs = ElevenLabs(api_key="soak-key", base_url=f"http://127.0.0.1:{port}")
+    hotword.api_key = ""  # no signed URL request; connect straight to the stand-in
+    for provider in hotword.dynamic_variables.providers.values():
+        if hasattr(provider.fetch, "client"):
+            provider.fetch.client = hotword.elevenlabs  # summary lookups hit the stand-in too
+    hotword.validate_audio_environment = lambda: True
+    hotword.shared_audio = FakePyAudio()
+    hotword.GPIO = FakeGPIO()
+    hotword.GPIO_BACKEND = 'RPi.GPIO'
+    hotword.STATUS_LED_PIN = 27
+    hotword.STATUS_LED_INITIALIZED = True
+    hotword.SESSION_COOLDOWN_SECONDS = 0
+
+    health = HealthMonitor(hotword.session_metrics)
+    hotword.start_background_threads()
+    tracemalloc.start(args.trace_frames)
+
+    print(f"Soak test: {args.sessions} sessions, work directory {workdir}")
+    started = time.monotonic()
+    baseline = baseline_snapshot = None
+    failures = []
+    growth_points = []  # (sessions since the baseline, traced heap growth)
+
+    for number in range(1, args.sessions + 1):
+        hotword.start_conversation_flow()
+
+        if number == args.warmup:
+            # A provider's first refresh with a finished conversation imports
+            # SDK models lazily; do it now rather than after the baseline
+            for provider in hotword.dynamic_variables.providers.values():
+                provider.fetch()
+            baseline = measure(health)
+            baseline_snapshot = take_snapshot()
+            print(f"[{number}] baseline {baseline}")
+            growth_points.append((0, 0))
+        elif baseline and (number - args.warmup) % args.snapshot_every == 0:
+            current = measure(health)
+            sessions = number - args.warmup
+            stats = take_snapshot().compare_to(baseline_snapshot, "lineno")
+            heap_growth = sum(stat.size_diff for stat in stats)
+            growth_points.append((sessions, heap_growth))
+            elapsed = time.monotonic() - started
+            print(
+                f"[{number}] {number / elapsed:.1f} sessions/s, heap +{heap_growth / sessions:.0f} "
+                f"B/session, RSS {current['rss_mb']} MB, fds {current['fds']}, "
+                f"threads {current['threads']}, timers {current['timers']}"
+            )
+
+    sessions = args.sessions - args.warmup
+    if baseline is None or sessions < args.snapshot_every:
+        server.shutdown()
+        hotword.stop_background_threads()
+        print("Not enough sessions for a comparison; increase --sessions.")
+        sys.exit(2)
+
+    # Measured while the server and background threads still run, like the
+    # baseline, so leaked threads and fds are not hidden by the shutdown
+    final = measure(health)
+    stats = take_snapshot().compare_to(baseline_snapshot, "lineno")
+    if growth_points[-1][0] != sessions:
+        growth_points.append((sessions, sum(stat.size_diff for stat in stats)))
+    heap_per_session = growth_slope(growth_points)
+    server.shutdown()
+    hotword.stop_background_threads()
+    summary = hotword.session_metrics.summary()["stations"].get(hotword.DEFAULT_STATION, {})
+
+    print("\nResult")
+    print(f"  sessions completed: {summary.get('sessions', 0)} of {args.sessions}, "
+          f"errors in event log: see {os.environ['EVENT_LOG_PATH']}")
+    print(f"  traced heap growth: {heap_per_session:.0f} B/session over {len(growth_points)} "
+          f"snapshots (budget {args.max_bytes_per_session:.0f})")
+    print(f"  RSS {baseline['rss_mb']} -> {final['rss_mb']} MB, fds {baseline['fds']} -> "
+          f"{final['fds']}, threads {baseline['threads']} -> {final['threads']}, "
+          f"timers {baseline['timers']} -> {final['timers']}, LED writes {FakeGPIO.writes}")
+
+    if heap_per_session > args.max_bytes_per_session:
+        failures.append(f"heap grows {heap_per_session:.0f} B per session")
+    if final["fds"] - baseline["fds"] > args.max_fd_growth:
+        failures.append(f"open fds grew by {final['fds'] - baseline['fds']}")
+    if final["threads"] - baseline["threads"] > args.max_thread_growth:
+        failures.append(f"threads grew by {final['threads'] - baseline['threads']}")
+    if summary.get("sessions", 0) < args.sessions:
+        failures.append(f"only {summary.get('sessions', 0)} sessions started")
+
+    print(f"\nTop {args.top} allocation sites by growth since warm-up:")
+    for stat in stats[:args.top]:
+        print(f"  {stat}")
+
+    if failures:
+        print("\nFAILED: " + "; ".join(failures))
+        sys.exit(1)
+    print("\nPASSED")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,484 @@
+"""Run several button/LED/audio stations from a single process.
+
+Usage:
+    python stations.py stations.json
+
+Each station has its own input/output device, button pin and LED pin. All
+stations share the ElevenLabs client (and its HTTP connection pool), one
+PortAudio instance and one GPIO polling thread. Every station runs its
+sessions on its own worker thread, so a long session in one room never
+blocks a button press in another. The SDK's websocket and PortAudio
+callback threads spend their time in socket and audio I/O, which releases
+the GIL, so the stations spread over the Pi's cores.
+
+Configuration file format:
+
+    {
+        "report_seconds": 300,
+        "stations": [
+            {"name": "kitchen", "button_pin": 17, "led_pin": 27,
+             "input_device": "ReSpeaker", "input_channels": 6, "input_channel": 0,
+             "output_device": "bluez"},
+            {"name": "hall", "button_pin": 22, "led_pin": 23,
+             "led_active_high": false, "input_device": 2, "output_device": 3}
+        ]
+    }
+
+Devices may be given as a PyAudio device index or as a name fragment;
+leave them out to use the system default. `input_channels` and
+`input_channel` select one channel of a multi-channel microphone (channel 0
+is the echo-cancelled one on the 6-channel ReSpeaker firmware). `room` is
+passed to the agent as the {{room}} variable (default: the station name).
+"""
+
+import json
+import signal
+import sys
+import threading
+import time
+
+import hotword
+from audio_interface import StationAudioInterface, load_profile, resolve_device
+from barge_in import BargeInDetector
+import scheduling
+
+DEBOUNCE_SECONDS = 0.3
+DEFAULT_REPORT_SECONDS = 300
+
+
+def load_station_config(path: str) -> dict:
+    """Read and validate a station configuration file."""
+
+    with open(path, "r", encoding="utf-8") as config_file:
+        data = json.load(config_file)
+
+    stations = data.get("stations")
+    if not stations:
+        raise ValueError(f"{path} defines no stations")
+
+    names = set()
+    pins = set()
+    for station in stations:
+        name = station.get("name")
+        if not name or name in names:
+            raise ValueError(f"Station names must be unique and non-empty: {name!r}")
+        names.add(name)
+        for key in ("button_pin", "led_pin"):
+            pin = station.get(key)
+            if pin is None:
+                continue
+            if pin in pins:
+                raise ValueError(f"GPIO {pin} is used by more than one station")
+            pins.add(pin)
+        if station.get("button_pin") is None:
+            raise ValueError(f"Station {name} has no button_pin")
+
+    return data
+
+
+class Station:
+    """One room: a button, an optional LED and a pair of audio devices."""
+
+    def __init__(self, daemon, name, button_pin, led_pin=None, led_active_high=True,
+                 input_device=None, output_device=None, input_channels=1, input_channel=0,
+                 room=None):
+        self.daemon = daemon
+        self.name = name
+        self.button_pin = button_pin
+        self.led_pin = led_pin
+        self.led_active_high = led_active_high
+        self.input_device = input_device
+        self.output_device = output_device
+        self.input_channels = input_channels
+        self.input_channel = input_channel
+        self.room = room or name
+
+        self.button_event = threading.Event()
+        self.pressed_at = None
+        self.last_press = 0.0
+        self.busy = False
+        self.conversation = None
+        self.led_line = None
+        self.led_initialized = False
+        self.led_meter = None
+        self.thinking_timer = None
+        self.thread = None
+
+    # LED handling mirrors the module-level helpers in hotword.py
+
+    def setup_led(self, chip=None):
+        if self.led_pin is None:
+            return
+        try:
+            if hotword.GPIO_BACKEND == 'gpiod':
+                import gpiod
+                self.led_line = chip.get_line(self.led_pin)
+                self.led_line.request(
+                    consumer=f'hanson-led-{self.name}',
+                    type=gpiod.LINE_REQ_DIR_OUT,
+                    default_vals=[0 if self.led_active_high else 1],
+                )
+            else:  # RPi.GPIO
+                GPIO = hotword.GPIO
+                GPIO.setup(
+                    self.led_pin,
+                    GPIO.OUT,
+                    initial=GPIO.LOW if self.led_active_high else GPIO.HIGH,
+                )
+            self.led_initialized = True
+        except (RuntimeError, OSError) as e:
+            print(f"[{self.name}] Could not initialize LED on GPIO {self.led_pin}: {e}")
+            return
+        self.led_meter = hotword.create_led_meter(
+            self.led_pin, self.led_active_high, self.led_line, allow_sysfs=False
+        )
+
+    def set_led(self, active: bool):
+        if not self.led_initialized:
+            return
+        if self.led_meter:
+            self.led_meter.set_base(active)
+            return
+        try:
+            if hotword.GPIO_BACKEND == 'gpiod':
+                self.led_line.set_value(1 if (active == self.led_active_high) else 0)
+            else:  # RPi.GPIO
+                GPIO = hotword.GPIO
+                GPIO.output(
+                    self.led_pin,
+                    GPIO.HIGH if (active == self.led_active_high) else GPIO.LOW,
+                )
+        except (RuntimeError, OSError) as e:
+            print(f"[{self.name}] Could not control LED: {e}")
+
+    def _cancel_thinking_timer(self):
+        timer = self.thinking_timer
+        if timer:
+            timer.cancel()
+            self.thinking_timer = None
+
+    def _complete_thinking(self):
+        self.set_led(False)
+        self.thinking_timer = None
+
+    def ring_idle(self):
+        self._cancel_thinking_timer()
+        self.set_led(False)
+
+    def ring_listening(self):
+        self._cancel_thinking_timer()
+        self.set_led(True)
+
+    def ring_thinking(self):
+        self._cancel_thinking_timer()
+        self.set_led(True)
+        if hotword.THINKING_BLINK_SECONDS > 0:
+            self.thinking_timer = threading.Timer(
+                hotword.THINKING_BLINK_SECONDS, self._complete_thinking
+            )
+            self.thinking_timer.start()
+
+    def ring_speaking(self):
+        self._cancel_thinking_timer()
+        self.set_led(True)
+
+    # Button and session handling
+
+    def press(self):
+        """Called from the shared GPIO thread when this station's button fires."""
+        now = time.monotonic()
+        if now - self.last_press <= DEBOUNCE_SECONDS:
+            return
+        self.last_press = now
+        if self.busy:
+            # Already in a session; ignore presses rather than queueing one.
+            return
+        self.pressed_at = now
+        self.button_event.set()
+
+    def run(self):
+        while not self.daemon.stop_event.is_set():
+            if self.button_event.wait(timeout=0.1):
+                self.busy = True
+                self.button_event.clear()
+                try:
+                    self.run_session()
+                finally:
+                    self.busy = False
+
+    def run_session(self):
+        event_log = hotword.event_log
+        session = event_log.new_session(self.name)
+        event_log.emit("session_start", session, station=self.name)
+        hotword.profiler.session_started(session)
+        self.ring_listening()
+        pressed_at = self.pressed_at or time.monotonic()
+        metrics = hotword.session_metrics
+        recording = None
+        conversation_id = None
+
+        try:
+            audio_interface = StationAudioInterface(
+                input_device_index=self.input_device,
+                output_device_index=self.output_device,
+                audio=self.daemon.audio,
+                input_channels=self.input_channels,
+                input_channel=self.input_channel,
+            )
+            barge_in = BargeInDetector.from_env(metrics, event_log, self.name, session)
+            if barge_in:
+                barge_in.attach(audio_interface)
+            if self.led_meter:
+                self.led_meter.attach(audio_interface)
+            if hotword.recordings:
+                recording = hotword.recordings.start_recording(session)
+                if recording:
+                    recording.attach(audio_interface)
+            self.conversation = hotword.create_conversation(
+                audio_interface=audio_interface,
+                station=self.name,
+                on_speaking=self.ring_speaking,
+                on_thinking=self.ring_thinking,
+                session=session,
+                room=self.room,
+            )
+            hotword.suppress_alsa_errors(self.conversation.start_session)()
+            metrics.increment(self.name, "sessions")
+            metrics.record(self.name, "session_start_ms", (time.monotonic() - pressed_at) * 1000)
+
+            conversation_id = self.conversation.wait_for_session_end()
+            event_log.emit(
+                "session_end", session, station=self.name, conversation_id=conversation_id
+            )
+        except Exception as e:
+            metrics.increment(self.name, "errors")
+            event_log.emit("session_error", session, station=self.name, error=str(e))
+        finally:
+            self.conversation = None
+            self.pressed_at = None
+            if recording:
+                recording.finish(conversation_id)
+            hotword.profiler.session_finished(session, conversation_id)
+            event_log.emit("session_finished", session, station=self.name)
+            self.ring_idle()
+
+    def end_session(self):
+        conversation = self.conversation
+        if conversation is not None:
+            try:
+                conversation.end_session()
+            except Exception as e:
+                print(f"[{self.name}] Error ending session: {e}")
+
+
+class StationDaemon:
+    """Owns the shared resources and the stations that use them."""
+
+    def __init__(self, station_config: dict):
+        self.stop_event = threading.Event()
+        self.audio = None
+        self.button_lines = None
+        self.report_seconds = float(
+            station_config.get("report_seconds", DEFAULT_REPORT_SECONDS)
+        )
+        self.station_config = station_config["stations"]
+        self.stations = []
+
+    def setup_audio(self):
+        """Open one PortAudio instance and resolve every station's devices."""
+        self.audio = hotword.suppress_alsa_errors(hotword.pyaudio.PyAudio)()
+        for entry in self.station_config:
+            station = Station(
+                self,
+                entry["name"],
+                entry["button_pin"],
+                led_pin=entry.get("led_pin"),
+                led_active_high=entry.get("led_active_high", True),
+                input_device=resolve_device(self.audio, entry.get("input_device"), True),
+                output_device=resolve_device(self.audio, entry.get("output_device"), False),
+                input_channels=entry.get("input_channels", 1),
+                input_channel=entry.get("input_channel", 0),
+                room=entry.get("room"),
+            )
+            self.stations.append(station)
+            print(
+                f"[{station.name}] button GPIO {station.button_pin}, LED "
+                f"{station.led_pin if station.led_pin is not None else '-'}, input "
+                f"{station.input_device if station.input_device is not None else 'default'}, "
+                f"output {station.output_device if station.output_device is not None else 'default'}"
+            )
+
+    def setup_gpio(self):
+        """Request every station's button and LED through the shared backend."""
+        if not hotword.GPIO_AVAILABLE:
+            raise RuntimeError(
+                f"No usable GPIO backend ({hotword.GPIO_IMPORT_ERROR or 'not installed'})"
+            )
+
+        if hotword.GPIO_BACKEND == 'gpiod':
+            import gpiod
+            chip, chip_path = hotword._get_or_open_gpiochip()
+            if chip is None:
+                raise RuntimeError("Could not find accessible gpiochip device")
+            for station in self.stations:
+                station.setup_led(chip)
+            # One bulk request lets a single thread wait on every button
+            self.button_lines = chip.get_lines([s.button_pin for s in self.stations])
+            self.button_lines.request(
+                consumer='hanson-stations',
+                type=gpiod.LINE_REQ_EV_FALLING_EDGE,
+                flags=gpiod.LINE_REQ_FLAG_BIAS_PULL_UP,
+            )
+            print(f"Buttons for {len(self.stations)} stations requested on {chip_path}.")
+        else:  # RPi.GPIO
+            GPIO = hotword.GPIO
+            GPIO.setwarnings(False)
+            GPIO.setmode(GPIO.BCM)
+            for station in self.stations:
+                station.setup_led()
+                GPIO.setup(station.button_pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+                # RPi.GPIO runs all edge callbacks on its own single thread
+                GPIO.add_event_detect(
+                    station.button_pin,
+                    GPIO.FALLING,
+                    callback=lambda channel, s=station: self.edge(s),
+                    bouncetime=int(DEBOUNCE_SECONDS * 1000),
+                )
+
+    @staticmethod
+    def edge(station):
+        """RPi.GPIO edge callback; its thread is not ours, so schedule it here."""
+        scheduling.apply("button")
+        station.press()
+
+    def poll_buttons(self):
+        """Wait for edge events on every station's button (gpiod only)."""
+        scheduling.apply("button")
+        by_pin = {station.button_pin: station for station in self.stations}
+        while not self.stop_event.is_set():
+            try:
+                events = self.button_lines.event_wait(nsec=100000000)  # 100ms timeout
+                if not events:
+                    continue
+                for line in events:
+                    line.event_read()
+                    station = by_pin.get(line.offset())
+                    if station:
+                        station.press()
+            except Exception as e:
+                if not self.stop_event.is_set():
+                    print(f"Error reading button events: {e}")
+                break
+
+    def report_loop(self):
+        while not self.stop_event.wait(self.report_seconds):
+            hotword.session_metrics.print_report()
+
+    def start(self):
+        hotword.start_background_threads()
+        threads = []
+        if hotword.GPIO_BACKEND == 'gpiod':
+            threads.append(threading.Thread(target=self.poll_buttons, name="gpio-poll", daemon=True))
+        if self.report_seconds > 0:
+            threads.append(threading.Thread(target=self.report_loop, name="metrics", daemon=True))
+        for station in self.stations:
+            station.ring_idle()
+            station.thread = threading.Thread(
+                target=station.run, name=f"station-{station.name}", daemon=True
+            )
+            threads.append(station.thread)
+        for thread in threads:
+            thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        for station in self.stations:
+            station.end_session()
+        stuck = []
+        for station in self.stations:
+            if station.thread:
+                station.thread.join(timeout=5)
+                if station.thread.is_alive():
+                    stuck.append(station.name)
+            station.ring_idle()
+        if stuck:
+            # Their sessions may still have streams open on the shared PyAudio
+            print(f"Stations {', '.join(stuck)} did not stop; leaving PortAudio running")
+        self.release(terminate_audio=not stuck)
+        hotword.stop_background_threads()
+        hotword.session_metrics.print_report()
+
+    def release(self, terminate_audio=True):
+        for station in self.stations:
+            if station.led_meter:
+                station.led_meter.stop()
+        if hotword.GPIO_BACKEND == 'gpiod':
+            if self.button_lines:
+                try:
+                    self.button_lines.release()
+                except Exception as e:
+                    print(f"Warning: Could not release button lines: {e}")
+            for station in self.stations:
+                if station.led_line:
+                    try:
+                        station.led_line.release()
+                    except Exception as e:
+                        print(f"Warning: Could not release LED line: {e}")
+            if hotword.gpiod_chip:
+                try:
+                    hotword.gpiod_chip.close()
+                except Exception as e:
+                    print(f"Warning: Could not close GPIO chip: {e}")
+        elif hotword.GPIO_AVAILABLE:
+            for station in self.stations:
+                try:
+                    hotword.GPIO.remove_event_detect(station.button_pin)
+                except (RuntimeError, ValueError):
+                    pass
+            hotword.GPIO.cleanup()
+        if self.audio and terminate_audio:
+            self.audio.terminate()
+
+
+def main():
+    if len(sys.argv) != 2:
+        print("Usage: python stations.py stations.json")
+        sys.exit(2)
+
+    try:
+        station_config = load_station_config(sys.argv[1])
+    except (OSError, ValueError) as e:
+        print(f"Could not load station configuration: {e}")
+        sys.exit(1)
+
+    daemon = StationDaemon(station_config)
+
+    # Only the main thread may install signal handlers, so SIGINT/SIGTERM end
+    # every station's session from here instead of per session.
+    def signal_handler(sig, frame):
+        print("Stopping stations...")
+        daemon.stop_event.set()
+
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+    hotword.profiler.install_signal_handler()
+
+    load_profile()
+    scheduling.install(hotword.scheduler)
+    try:
+        daemon.setup_audio()
+        daemon.setup_gpio()
+    except (RuntimeError, ValueError, OSError) as e:
+        print(f"Could not start stations: {e}")
+        daemon.release()
+        sys.exit(1)
+
+    daemon.start()
+    print(f"{len(daemon.stations)} stations ready (CTRL+C to exit).")
+    while not daemon.stop_event.wait(0.5):
+        pass
+    daemon.stop()
+
+
+if __name__ == "__main__":
+    main()
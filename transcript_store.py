@@ -0,0 +1,373 @@
+"""Searchable SQLite store of past conversations.
+
+Turns reach the store through the event log: the event log writer hands
+each flushed batch to `TranscriptStore.handle_events()`, which only puts
+it on a queue. A dedicated thread owns the SQLite connection (WAL mode)
+and writes everything that has queued up in a single transaction, so SDK
+callbacks never wait for the disk.
+
+Schema: `sessions` maps the local session key to the conversation ID that
+`wait_for_session_end()` returns, `turns` holds one row per user or agent
+turn, and `turns_fts` is an FTS5 index over the turn text. When the user
+interrupts the agent, the agent turn is updated to the corrected (spoken)
+text rather than stored twice.
+
+Command line:
+
+    python transcript_store.py search "väder imorgon"
+    python transcript_store.py show <conversation_id>
+    python transcript_store.py recent -n 10
+    python transcript_store.py bench --turns 1000000
+"""
+
+import argparse
+import os
+import queue
+import random
+import sqlite3
+import statistics
+import sys
+import threading
+import time
+
+DEFAULT_PATH = os.path.join("data", "transcripts.db")
+BATCH_LIMIT = 2000  # records per transaction
+
+# Event kinds that become turns, and the role they are stored under
+TURN_KINDS = {
+    "user_transcript": "user",
+    "agent_response": "agent",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session TEXT PRIMARY KEY,
+    conversation_id TEXT,
+    station TEXT,
+    started REAL,
+    ended REAL
+);
+CREATE INDEX IF NOT EXISTS sessions_conversation ON sessions(conversation_id);
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY,
+    session TEXT NOT NULL,
+    ts REAL NOT NULL,
+    role TEXT NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS turns_session ON turns(session, id);
+CREATE VIRTUAL TABLE IF NOT EXISTS turns_fts USING fts5(
+    text, content='turns', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS turns_ai AFTER INSERT ON turns BEGIN
+    INSERT INTO turns_fts(rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS turns_ad AFTER DELETE ON turns BEGIN
+    INSERT INTO turns_fts(turns_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS turns_au AFTER UPDATE OF text ON turns BEGIN
+    INSERT INTO turns_fts(turns_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    INSERT INTO turns_fts(rowid, text) VALUES (new.id, new.text);
+END;
+"""
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """Open the database in WAL mode and make sure the schema exists."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class TranscriptStore:
+    """Background writer plus read helpers for the transcript database."""
+
+    def __init__(self, path=DEFAULT_PATH, flush_seconds=0.5):
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self.written_turns = 0
+        self._queue = queue.SimpleQueue()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_env(cls):
+        """Store at TRANSCRIPT_DB, or None when the variable is set empty."""
+        path = os.getenv("TRANSCRIPT_DB", DEFAULT_PATH)
+        return cls(path) if path else None
+
+    def handle_events(self, records: list):
+        """Event log sink: queue a batch of event records for writing."""
+        if self._thread is not None:
+            self._queue.put(records)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        # Create the schema up front so configuration errors surface at startup
+        connect(self.path).close()
+        self._thread = threading.Thread(target=self._run, name="transcript-store", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Write everything queued so far and stop the writer thread."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        connection = connect(self.path)
+        try:
+            while True:
+                try:
+                    records = self._queue.get(timeout=self.flush_seconds)
+                except queue.Empty:
+                    if self._stop.is_set():
+                        return
+                    continue
+                # Gather whatever else is already waiting into the same transaction
+                while len(records) < BATCH_LIMIT:
+                    try:
+                        records = records + self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                try:
+                    self._write(connection, records)
+                except sqlite3.Error as e:
+                    print(f"Could not write transcripts: {e}")
+        finally:
+            connection.close()
+
+    def _write(self, connection, records):
+        turns = []
+        connection.execute("BEGIN")
+        try:
+            for record in records:
+                kind = record.get("kind")
+                session = record.get("session")
+                if not session:
+                    continue
+                if kind in TURN_KINDS:
+                    turns.append((session, record["ts"], TURN_KINDS[kind], record.get("text") or ""))
+                elif kind == "agent_response_correction":
+                    self._correct(connection, turns, session, record)
+                elif kind == "session_start":
+                    connection.execute(
+                        "INSERT OR IGNORE INTO sessions(session, station, started) VALUES (?, ?, ?)",
+                        (session, record.get("station"), record["ts"]),
+                    )
+                elif kind == "session_end":
+                    if turns:
+                        connection.executemany(
+                            "INSERT INTO turns(session, ts, role, text) VALUES (?, ?, ?, ?)", turns
+                        )
+                        self.written_turns += len(turns)
+                        turns = []
+                    connection.execute(
+                        "INSERT INTO sessions(session, station, conversation_id, ended) "
+                        "VALUES (?, ?, ?, ?) ON CONFLICT(session) DO UPDATE SET "
+                        "conversation_id = excluded.conversation_id, ended = excluded.ended",
+                        (session, record.get("station"), record.get("conversation_id"), record["ts"]),
+                    )
+            if turns:
+                connection.executemany(
+                    "INSERT INTO turns(session, ts, role, text) VALUES (?, ?, ?, ?)", turns
+                )
+                self.written_turns += len(turns)
+            connection.execute("COMMIT")
+        except sqlite3.Error:
+            connection.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _correct(connection, turns, session, record):
+        """Replace the agent turn that was cut short with what was actually said."""
+        original, corrected = record.get("original"), record.get("corrected") or ""
+        # Still waiting in this batch?
+        for index in range(len(turns) - 1, -1, -1):
+            turn_session, ts, role, text = turns[index]
+            if turn_session == session and role == "agent" and text == original:
+                turns[index] = (turn_session, ts, role, corrected)
+                return
+        updated = connection.execute(
+            "UPDATE turns SET text = ? WHERE id = (SELECT id FROM turns "
+            "WHERE session = ? AND role = 'agent' AND text = ? ORDER BY id DESC LIMIT 1)",
+            (corrected, session, original),
+        ).rowcount
+        if not updated:
+            # The original response never reached the store
+            turns.append((session, record["ts"], "agent", corrected))
+
+
+# Read side, used by the CLI and by other modules
+
+def search(connection, query: str, limit: int = 20) -> list:
+    """Full-text search over all turns, best matches first."""
+    return connection.execute(
+        "SELECT s.conversation_id, t.ts, t.role, "
+        "snippet(turns_fts, 0, '[', ']', '…', 12) "
+        "FROM turns_fts JOIN turns t ON t.id = turns_fts.rowid "
+        "LEFT JOIN sessions s ON s.session = t.session "
+        "WHERE turns_fts MATCH ? ORDER BY rank LIMIT ?",
+        (query, limit),
+    ).fetchall()
+
+
+def conversation_turns(connection, conversation_id: str) -> list:
+    """All turns of one conversation in order."""
+    return connection.execute(
+        "SELECT t.ts, t.role, t.text FROM sessions s JOIN turns t ON t.session = s.session "
+        "WHERE s.conversation_id = ? ORDER BY t.id",
+        (conversation_id,),
+    ).fetchall()
+
+
+def recent_sessions(connection, limit: int = 10) -> list:
+    """The latest sessions with their turn counts, newest first."""
+    return connection.execute(
+        "SELECT s.conversation_id, s.station, s.started, s.ended, "
+        "(SELECT COUNT(*) FROM turns t WHERE t.session = s.session) "
+        "FROM sessions s ORDER BY s.started DESC LIMIT ?",
+        (limit,),
+    ).fetchall()
+
+
+def _time(ts) -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts)) if ts else "-"
+
+
+WORDS = (
+    "hej väder imorgon regn sol lampa köket musik timer påminnelse kalender "
+    "möte nyheter temperatur hallen dörren larm middag recept handla lista "
+    "spela pausa volym högre lägre tack vad är klockan hur mycket"
+).split()
+SYLLABLES = "ka lo mi ne sa tu ve ri bo gä strö fjä kn ull ing ar en".split()
+
+
+def _vocabulary(rng, size=5000):
+    """Common words first, then made-up words; picked with Zipf-like weights
+    so the benchmark sees a realistic mix of frequent and rare terms."""
+    words = list(WORDS)
+    seen = set(words)
+    while len(words) < size:
+        word = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    cumulative, total = [], 0.0
+    for rank in range(len(words)):
+        total += 1.0 / (rank + 1)
+        cumulative.append(total)
+    return words, cumulative
+
+
+def benchmark(path: str, total_turns: int, turns_per_session: int = 20, queries: int = 200):
+    """Insert `total_turns` synthetic turns through the writer thread, then
+    time full-text searches."""
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    rng = random.Random(1)
+    words, cumulative = _vocabulary(rng)
+    # Pre-generate texts so the timing measures the store, not the generator
+    texts = [
+        " ".join(rng.choices(words, cum_weights=cumulative, k=rng.randint(4, 16)))
+        for _ in range(20000)
+    ]
+    store = TranscriptStore(path)
+    store.start()
+
+    print(f"Inserting {total_turns} turns into {path}...")
+    started = time.perf_counter()
+    sessions = total_turns // turns_per_session
+    batch = []
+    now = time.time()
+    for number in range(sessions):
+        session = f"bench-{number}"
+        batch.append({"ts": now, "kind": "session_start", "session": session, "station": "bench"})
+        for turn in range(turns_per_session):
+            kind = "user_transcript" if turn % 2 == 0 else "agent_response"
+            text = texts[rng.randrange(len(texts))]
+            batch.append({"ts": now, "kind": kind, "session": session, "text": text})
+        batch.append({"ts": now, "kind": "session_end", "session": session,
+                      "station": "bench", "conversation_id": f"conv-{number}"})
+        if len(batch) >= 1000:
+            store.handle_events(batch)
+            batch = []
+    if batch:
+        store.handle_events(batch)
+    store.close()
+    elapsed = time.perf_counter() - started
+    print(f"  {store.written_turns} turns in {elapsed:.1f} s "
+          f"({store.written_turns / elapsed:,.0f} turns/s)")
+
+    connection = connect(path)
+    latencies = []
+    for _ in range(queries):
+        query = " ".join(rng.sample(words[10:500], rng.randint(1, 2)))
+        started = time.perf_counter()
+        search(connection, query, limit=20)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    print(f"  search over {queries} queries: p50 {statistics.median(latencies):.1f} ms, "
+          f"p95 {latencies[int(0.95 * (len(latencies) - 1))]:.1f} ms, max {latencies[-1]:.1f} ms")
+    print(f"  database size {os.path.getsize(path) / 1024 / 1024:.1f} MB")
+    connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query stored conversations.")
+    parser.add_argument("--db", default=os.getenv("TRANSCRIPT_DB") or DEFAULT_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    search_parser = commands.add_parser("search", help="full-text search (FTS5 syntax)")
+    search_parser.add_argument("query")
+    search_parser.add_argument("-n", "--limit", type=int, default=20)
+
+    show_parser = commands.add_parser("show", help="print one conversation")
+    show_parser.add_argument("conversation_id")
+
+    recent_parser = commands.add_parser("recent", help="list the latest conversations")
+    recent_parser.add_argument("-n", "--limit", type=int, default=10)
+
+    bench_parser = commands.add_parser("bench", help="measure insert and search speed")
+    bench_parser.add_argument("--turns", type=int, default=1000000)
+    bench_parser.add_argument("--bench-db", default=os.path.join("data", "transcripts-bench.db"))
+
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        benchmark(args.bench_db, args.turns)
+        return
+
+    if not os.path.exists(args.db):
+        print(f"No transcript database at {args.db}")
+        sys.exit(1)
+    connection = connect(args.db)
+
+    if args.command == "search":
+        try:
+            rows = search(connection, args.query, args.limit)
+        except sqlite3.OperationalError as e:
+            print(f"Invalid search query: {e}")
+            sys.exit(1)
+        for conversation_id, ts, role, snippet in rows:
+            print(f"{_time(ts)} {conversation_id or '-'} {role}: {snippet}")
+    elif args.command == "show":
+        for ts, role, text in conversation_turns(connection, args.conversation_id):
+            print(f"{_time(ts)} {'You' if role == 'user' else 'Agent'}: {text}")
+    elif args.command == "recent":
+        for conversation_id, station, started, ended, turns in recent_sessions(connection, args.limit):
+            print(f"{_time(started)} {station or '-'} {conversation_id or '(ongoing)'} {turns} turns")
+
+
+if __name__ == "__main__":
+    main()